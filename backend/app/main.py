@@ -1,21 +1,65 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from dotenv import load_dotenv
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Literal, Optional, get_args
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import json
+import os
+import time
 import uuid
-from .models import DreamInput, DreamCollection, DreamEntry, DreamUpdate, SMARTGoal, Milestone
+from .models import DreamInput, DreamCollection, DreamEntry, DreamUpdate, SMARTGoal, Milestone, DreamCategory, PolishBatchRequest
+from .models import JournalEntry, JournalEntryInput, JournalEntryUpdate, MilestoneUpdate
 from .services.analysis_service import analysis_service
-from .services.storage_service import storage_service
+from .services.storage_service import storage_service, validate_owner
 from .services.search_service import search_service
+from .services.executors import storage_pool, embedding_pool, pool_stats, PoolSaturatedError
+from .services.metrics import metrics, profiler_from_env
+from .services.bulk_io import EXPORT_PAGE_SIZE, IMPORT_BATCH_SIZE, IMPORT_MAX_LINE_BYTES, NDJSONImporter, import_checkpoint_path
 
 load_dotenv()
 
-app = FastAPI(title="MyDreams AI Engine")
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Near-duplicate dreams: "flag" marks them with duplicate_of, "merge" folds them into the
+# dream they duplicate, "off" skips the check. Similarity is the cosine of the embeddings
+DedupMode = Literal["off", "flag", "merge"]
+DEDUP_MODE = os.getenv("DEDUP_MODE", "flag").strip().lower()
+if DEDUP_MODE not in get_args(DedupMode):
+    # Anything unrecognized would otherwise silently merge dreams
+    raise ValueError(f"DEDUP_MODE must be one of {', '.join(get_args(DedupMode))}, not {DEDUP_MODE!r}")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+if not 0 < DEDUP_THRESHOLD <= 1:
+    raise ValueError(f"DEDUP_THRESHOLD must be a similarity in (0, 1], not {DEDUP_THRESHOLD}")
+
+async def warm_up():
+    """Load the embedding model, embeddings and LLM client in the background."""
+    try:
+        analysis_service.llm
+        await embedding_pool.run(search_service.warm_up)
+        print(f"Warm-up complete (search model loaded in {search_service.model_load_seconds:.1f}s)")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup never waits for the models; /health/ready reports when they are loaded
+    warmup_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    storage_pool.shutdown()
+    embedding_pool.shutdown()
+    # Persist any embeddings written since the last periodic save
+    search_service.flush()
+    storage_service.compact()
+
+app = FastAPI(title="MyDreams AI Engine", lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 
 # CORS configuration - allow localhost and production domains
-import os
 allowed_origins = [
     "http://localhost:3000",
     "http://localhost:3001",  # Alternative local port
@@ -32,16 +76,162 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursor and ETag of GET /dreams must be readable from the browser
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+profiler = profiler_from_env()
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    token = profiler.begin() if profiler is not None else None
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    except Exception as e:
+        metrics.inc("http_unhandled_exceptions_total", route=_route_label(request), type=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        # The route template, not the raw path, so ids don't explode the label set
+        route = _route_label(request)
+        metrics.inc("http_requests_total", method=request.method, route=route, status=status)
+        metrics.observe("http_request_duration_seconds", elapsed, method=request.method, route=route)
+        if token is not None:
+            dump = profiler.end(token, elapsed, f"{request.method} {route}")
+            if dump is not None:
+                print(f"Slow request {request.method} {request.url.path} took {elapsed * 1000:.0f}ms; stacks in {dump}")
+
+def _route_label(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+def _service_samples():
+    """Gauges and totals the services already track, read at scrape time."""
+    for name, stats in pool_stats().items():
+        yield "executor_active", "gauge", "Jobs running in a worker pool", {"pool": name}, stats["active"]
+        yield "executor_queued", "gauge", "Jobs waiting for a worker", {"pool": name}, stats["queued"]
+        yield "executor_rejected_total", "counter", "Jobs refused because the queue was full", {"pool": name}, stats["rejected"]
+    cache = analysis_service.cache.stats()
+    yield "llm_cache_entries", "gauge", "Entries in the LLM response cache", {}, cache["entries"]
+    yield "llm_cache_lookups_total", "counter", "LLM cache lookups by result", {"result": "hit"}, cache["hits"]
+    yield "llm_cache_lookups_total", "counter", "LLM cache lookups by result", {"result": "disk_hit"}, cache["disk_hits"]
+    yield "llm_cache_lookups_total", "counter", "LLM cache lookups by result", {"result": "miss"}, cache["misses"]
+    dispatch = analysis_service.dispatcher.stats()
+    yield "llm_dispatch_active", "gauge", "LLM calls holding a concurrency slot", {}, dispatch["active"]
+    yield "llm_dispatch_queued", "gauge", "LLM calls waiting for a slot", {}, dispatch["queued"]
+
+metrics.add_collector(_service_samples)
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 @app.get("/")
 async def root():
     return {"message": "MyDreams AI Engine is running"}
 
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    # Without warm-up the models load lazily on first use, so there is nothing to wait for
+    ready = search_service.ready or not WARMUP_ON_STARTUP
+    return JSONResponse(status_code=200 if ready else 503, content={
+        "ready": ready,
+        "search": search_service.status(),
+        "llm_client_initialized": analysis_service.ready,
+    })
+
+def get_owner(x_user_id: Optional[str] = Header(None)) -> Optional[str]:
+    """Owner key that partitions storage and search; requests without one use the default owner."""
+    if x_user_id is None:
+        return None
+    try:
+        return validate_owner(x_user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/health/pools")
+async def get_pool_stats():
+    return pool_stats()
+
+@app.get("/health/llm-cache")
+async def get_llm_cache_stats():
+    return analysis_service.cache.stats()
+
+@app.get("/health/llm")
+async def get_llm_dispatch_stats():
+    return analysis_service.dispatcher.stats()
+
+@app.get("/health/analysis-repair")
+async def get_analysis_repair_stats():
+    return analysis_service.repair.stats()
+
+def _duplicate_roots(dream_ids: Iterable[str], owner: Optional[str]) -> Dict[str, str]:
+    """The original each stored dream stands for: flagged duplicates stay searchable,
+    so a match on one is followed through duplicate_of to the dream it duplicates."""
+    roots = {}
+    for dream_id in dream_ids:
+        dream = storage_service.get_dream_by_id(dream_id, owner=owner)
+        seen = {dream_id}
+        while dream is not None and dream.duplicate_of and dream.duplicate_of not in seen:
+            original = storage_service.get_dream_by_id(dream.duplicate_of, owner=owner)
+            if original is None:
+                # The original was deleted: the duplicate now stands for itself
+                break
+            seen.add(original.id)
+            dream = original
+        roots[dream_id] = dream.id if dream is not None else dream_id
+    return roots
+
+async def _duplicate_targets(dreams: List[DreamEntry], threshold: float, owner: Optional[str]) -> List[Optional[str]]:
+    """For each dream, the id of the stored or earlier-in-batch dream it duplicates, or None."""
+    if not dreams:
+        return []
+    texts = [f"{d.title} {d.category.value}" for d in dreams]
+    try:
+        matches = await embedding_pool.run(search_service.find_duplicates, texts, threshold, owner=owner)
+    except Exception as e:
+        # A busy or failing encoder must not block saving
+        print(f"Duplicate check skipped: {e}")
+        return [None] * len(dreams)
+    stored = {match["dream_id"] for match in matches if match is not None and "dream_id" in match}
+    roots = await storage_pool.run(_duplicate_roots, stored, owner) if stored else {}
+    targets: List[Optional[str]] = []
+    for match in matches:
+        if match is None:
+            targets.append(None)
+        elif "dream_id" in match:
+            targets.append(roots[match["dream_id"]])
+        else:
+            # Point at what the earlier dream duplicates, if it is a duplicate itself
+            earlier = match["batch_index"]
+            targets.append(targets[earlier] or dreams[earlier].id)
+    return targets
+
 @app.post("/analyze", response_model=DreamCollection)
-async def analyze_dreams(dream: DreamInput):
+async def analyze_dreams(dream: DreamInput, fresh: bool = False, dedup: Optional[DedupMode] = None,
+                         owner: Optional[str] = Depends(get_owner)):
     try:
-        result = await analysis_service.analyze_dreams(dream)
+        # fresh=true bypasses the LLM cache when the user explicitly wants a new answer
+        result = await analysis_service.analyze_dreams(dream, use_cache=not fresh)
+        # Nothing is saved yet, so duplicates are only flagged; saving them with dedup=merge merges them
+        if (dedup or DEDUP_MODE) != "off":
+            targets = await _duplicate_targets(result.dreams, DEDUP_THRESHOLD, owner)
+            result = DreamCollection(dreams=[
+                d.model_copy(update={"duplicate_of": target}) if target else d
+                for d, target in zip(result.dreams, targets)
+            ])
         return result
     except ConnectionError as e:
         raise HTTPException(status_code=503, detail=str(e))
@@ -53,90 +243,385 @@ async def analyze_dreams(dream: DreamInput):
         raise HTTPException(status_code=500, detail="Unable to analyze dreams. Please try rephrasing your input.")
 
 @app.post("/dreams/{dream_id}/polish", response_model=SMARTGoal)
-async def polish_dream(dream_id: str):
-    dream = storage_service.get_dream_by_id(dream_id)
+async def polish_dream(dream_id: str, fresh: bool = False, owner: Optional[str] = Depends(get_owner)):
+    dream = await storage_pool.run(storage_service.get_dream_by_id, dream_id, owner=owner)
     if not dream:
         raise HTTPException(status_code=404, detail="Dream not found")
     
     try:
-        smart_data = await analysis_service.polish_dream(dream.title)
-        storage_service.update_dream(dream_id, {
+        smart_data = await analysis_service.polish_dream(dream.title, use_cache=not fresh)
+        await storage_pool.run(storage_service.update_dream, dream_id, {
             "is_polished": True,
             "smart_data": smart_data.model_dump(),
             "title": smart_data.polished_title
-        })
+        }, owner=owner)
         return smart_data
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         import traceback
         print(f"Error in polish_dream for ID {dream_id}: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+POLISH_BATCH_CONCURRENCY = int(os.getenv("POLISH_BATCH_CONCURRENCY", "4"))
+
+@app.post("/dreams/polish/batch")
+async def polish_dreams_batch(request: PolishBatchRequest, owner: Optional[str] = Depends(get_owner)):
+    """Polish many dreams concurrently, streaming one NDJSON line per dream as it
+    finishes, then store every smart_data update in a single transaction."""
+    dreams = await storage_pool.run(storage_service.get_dreams_by_ids, request.dream_ids, owner=owner)
+    semaphore = asyncio.Semaphore(POLISH_BATCH_CONCURRENCY)
+
+    async def polish_one(dream: DreamEntry):
+        async with semaphore:
+            try:
+                smart_data = await analysis_service.polish_dream(
+                    dream.title, use_cache=not request.fresh, endpoint="bulk_polish"
+                )
+                return dream, smart_data, None
+            except Exception as e:
+                print(f"Error in batch polish for ID {dream.id}: {str(e)}")
+                return dream, None, str(e)
+
+    async def events():
+        for dream_id in request.dream_ids:
+            if dream_id not in dreams:
+                yield json.dumps({"id": dream_id, "error": "Dream not found"}) + "\n"
+
+        updates = {}
+        tasks = [asyncio.ensure_future(polish_one(d)) for d in dreams.values()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                dream, smart_data, error = await next_done
+                if error is not None:
+                    yield json.dumps({"id": dream.id, "error": error}) + "\n"
+                    continue
+                updates[dream.id] = {
+                    "is_polished": True,
+                    "smart_data": smart_data.model_dump(),
+                    "title": smart_data.polished_title
+                }
+                yield json.dumps({"id": dream.id, "smart_data": smart_data.model_dump()}) + "\n"
+        finally:
+            # Stop outstanding LLM work if the client went away
+            for task in tasks:
+                task.cancel()
+            # ...but keep every polish that already finished. The commit runs as its
+            # own task, so a disconnect cancelling this generator can't abandon it
+            if updates:
+                commit = asyncio.ensure_future(storage_pool.run(storage_service.update_dreams, updates, owner=owner))
+                await asyncio.shield(commit)
+
+        yield json.dumps({"done": True, "polished": len(updates)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.get("/dreams/{dream_id}/roadmap")
-async def get_roadmap(dream_id: str, age: int = 30):
-    dream = storage_service.get_dream_by_id(dream_id)
+async def get_roadmap(dream_id: str, age: int = 30, persist: bool = False,
+                      stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$"),
+                      owner: Optional[str] = Depends(get_owner)):
+    dream = await storage_pool.run(storage_service.get_dream_by_id, dream_id, owner=owner)
     if not dream:
         raise HTTPException(status_code=404, detail="Dream not found")
-    
+
+    async def events():
+        milestones = []
+        async for milestone in analysis_service.generate_roadmap(dream, age):
+            milestones.append(milestone)
+            payload = milestone.model_dump_json()
+            yield f"event: milestone\ndata: {payload}\n\n" if stream_format == "sse" else payload + "\n"
+
+        if persist and milestones:
+            await storage_pool.run(storage_service.update_dream, dream_id, {
+                "milestones": [m.model_dump() for m in milestones]
+            }, owner=owner)
+        if stream_format == "sse":
+            yield f"event: done\ndata: {json.dumps({'count': len(milestones), 'persisted': persist and bool(milestones)})}\n\n"
+
+    # One milestone per NDJSON line (or SSE event), sent the moment it is complete
     return StreamingResponse(
-        analysis_service.generate_roadmap(dream, age),
-        media_type="application/json"
+        events(),
+        media_type="text/event-stream" if stream_format == "sse" else "application/x-ndjson"
     )
 
 @app.get("/search")
-async def search_dreams(q: str = Query(..., min_length=1)):
+async def search_dreams(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(5, ge=1, le=100),
+    category: Optional[DreamCategory] = None,
+    year: Optional[int] = None,
+    mode: Literal["hybrid", "semantic", "lexical"] = "hybrid",
+    owner: Optional[str] = Depends(get_owner),
+):
     try:
-        results = search_service.search_dreams(q)
+        # Lexical lookups never touch the encoder, so they don't queue behind it
+        pool = storage_pool if search_service.is_lexical(q, mode) else embedding_pool
+        results = await pool.run(
+            search_service.search_dreams, q, limit=limit, category=category.value if category else None,
+            year=year, mode=mode, owner=owner
+        )
         return results
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/dreams/batch", response_model=List[DreamEntry])
-async def save_dreams_batch(dreams: List[DreamEntry]):
+async def save_dreams_batch(dreams: List[DreamEntry], dedup: Optional[DedupMode] = None,
+                            dedup_threshold: Optional[float] = Query(None, gt=0, le=1),
+                            owner: Optional[str] = Depends(get_owner)):
     try:
-        dreams_data = []
+        entries = []
         for d in dreams:
-            dump = d.model_dump()
             # Ensure ID is a valid UUID string, not a title fragment
-            if not dump.get("id") or (isinstance(dump["id"], str) and " " in dump["id"]):
-                dump["id"] = str(uuid.uuid4())
-            dreams_data.append(dump)
-            
-        storage_service.save_dreams(dreams_data)
-        return [DreamEntry(**d) for d in dreams_data]
+            if not d.id or " " in d.id:
+                d = d.model_copy(update={"id": str(uuid.uuid4())})
+            entries.append(d)
+
+        mode = dedup or DEDUP_MODE
+        targets = {}
+        if mode != "off":
+            # Dreams that already exist are updates, not candidates
+            stored = await storage_pool.run(storage_service.get_dreams_by_ids, [d.id for d in entries], owner=owner)
+            new = [d for d in entries if d.id not in stored]
+            found = await _duplicate_targets(new, dedup_threshold if dedup_threshold is not None else DEDUP_THRESHOLD, owner)
+            targets = {d.id: target for d, target in zip(new, found) if target}
+        if mode == "flag":
+            entries = [d.model_copy(update={"duplicate_of": targets[d.id]}) if d.id in targets else d for d in entries]
+            targets = {}
+
+        # The request body is already validated: store and echo it without another pass
+        await storage_pool.run(storage_service.save_dreams, [d for d in entries if d.id not in targets], owner=owner)
+        if targets:
+            merges = [(targets[d.id], d) for d in entries if d.id in targets]
+            results = await storage_pool.run(storage_service.merge_dreams, merges, owner=owner)
+            lost = [d for (_, d), result in zip(merges, results) if result is None]
+            if lost:
+                # Their target was deleted meanwhile: keep them as new dreams
+                await storage_pool.run(storage_service.save_dreams, lost, owner=owner)
+                targets = {dream_id: target for dream_id, target in targets.items() if dream_id not in {d.id for d in lost}}
+            # A merged duplicate is answered with the dream it was merged into, as of the last merge
+            latest = {result.id: result for result in results if result is not None}
+            entries = [latest.get(targets.get(d.id, d.id), d) for d in entries]
+        return Response(
+            content=b"[" + b",".join(d.model_dump_json().encode("utf-8") for d in entries) + b"]",
+            media_type="application/json",
+        )
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+def _etag(version: str, query_key: str) -> str:
+    return '"' + hashlib.sha1(f"{version}|{query_key}".encode("utf-8")).hexdigest()[:24] + '"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
 @app.get("/dreams", response_model=List[DreamEntry])
-async def get_dreams():
+async def get_dreams(
+    request: Request,
+    category: Optional[DreamCategory] = None,
+    completed: Optional[bool] = None,
+    year: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,title,category"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    owner: Optional[str] = Depends(get_owner),
+):
+    """List dreams, optionally filtered, projected and paginated.
+
+    Records are served straight from storage without re-validation. When
+    more records remain, the cursor for the next page is returned in the
+    X-Next-Cursor header. Responses carry an ETag tied to the storage
+    version, so an unchanged listing is answered with 304 Not Modified.
+    """
+    field_list = None
+    if fields:
+        field_list = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in field_list if f not in DreamEntry.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    query_key = json.dumps([category.value if category else None, completed, year, field_list, cursor, limit])
+
     try:
-        data = storage_service.get_all_dreams()
-        return data
+        version = await storage_pool.run(storage_service.version, owner=owner)
+        etag = _etag(version, query_key)
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+        filters = dict(category=category.value if category else None, completed=completed, year=year)
+        if field_list is None:
+            # Full records: concatenate each dream's cached JSON
+            content, next_cursor, version = await storage_pool.run(
+                storage_service.list_dreams_json, owner=owner, cursor=cursor, limit=limit, **filters
+            )
+        else:
+            records, next_cursor, version = await storage_pool.run(
+                storage_service.list_dreams, owner=owner, fields=field_list, cursor=cursor, limit=limit, **filters
+            )
+            content = json.dumps(records)
+    except PoolSaturatedError:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+    headers = {"ETag": _etag(version, query_key), "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@app.get("/dreams/export")
+async def export_dreams(owner: Optional[str] = Depends(get_owner)):
+    """Every dream as NDJSON, read one page at a time so memory stays flat."""
+    async def pages():
+        cursor = None
+        while True:
+            data, cursor = await storage_pool.run(
+                storage_service.export_ndjson, owner, cursor=cursor, limit=EXPORT_PAGE_SIZE
+            )
+            if data:
+                yield data
+            if cursor is None:
+                return
+
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
+
+@app.post("/dreams/import")
+async def import_dreams(request: Request, import_id: Optional[str] = None,
+                        owner: Optional[str] = Depends(get_owner)):
+    """Import an NDJSON body in batches as it arrives.
+
+    With an import_id, progress is checkpointed after every batch: sending the
+    same body again with the same id skips the lines already saved.
+    """
+    try:
+        checkpoint = import_checkpoint_path(owner, import_id) if import_id else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    importer = NDJSONImporter(owner, checkpoint)
+
+    buffer, batch = b"", []
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"NDJSON lines must be under {IMPORT_MAX_LINE_BYTES} bytes")
+        batch.extend(lines)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await storage_pool.run(importer.write_batch, batch)
+            batch = []
+    batch.append(buffer)
+    await storage_pool.run(importer.write_batch, batch)
+    return await storage_pool.run(importer.finish)
+
+@app.get("/dreams/stats")
+async def get_dream_stats(request: Request, owner: Optional[str] = Depends(get_owner)):
+    """Counts and completion rates by category and target year, plus milestone progress.
+
+    Storage keeps these aggregates up to date on every write, so this costs
+    the same for ten dreams or a million.
+    """
+    stats, version = await storage_pool.run(storage_service.stats, owner=owner)
+    etag = _etag(version, "stats")
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=stats, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
 @app.get("/dreams/{dream_id}", response_model=DreamEntry)
-async def get_dream(dream_id: str):
-    dream = storage_service.get_dream_by_id(dream_id)
-    if not dream:
+async def get_dream(dream_id: str, owner: Optional[str] = Depends(get_owner)):
+    # Cached bytes, so an unchanged dream is neither validated nor serialized again
+    data = await storage_pool.run(storage_service.get_dream_json, dream_id, owner=owner)
+    if data is None:
         raise HTTPException(status_code=404, detail="Dream not found")
-    return dream
+    return Response(content=data, media_type="application/json")
 
 @app.patch("/dreams/{dream_id}", response_model=DreamEntry)
-async def update_dream(dream_id: str, updates: DreamUpdate):
-    updated = storage_service.update_dream(dream_id, updates.model_dump(exclude_unset=True))
+async def update_dream(dream_id: str, updates: DreamUpdate, owner: Optional[str] = Depends(get_owner)):
+    updated = await storage_pool.run(
+        storage_service.update_dream, dream_id, updates.model_dump(exclude_unset=True), owner=owner
+    )
     if not updated:
         raise HTTPException(status_code=404, detail="Dream not found")
-    return updated
+    return Response(content=updated.model_dump_json(), media_type="application/json")
 
 @app.delete("/dreams/{dream_id}")
-async def delete_dream(dream_id: str):
-    success = storage_service.delete_dream(dream_id)
+async def delete_dream(dream_id: str, owner: Optional[str] = Depends(get_owner)):
+    success = await storage_pool.run(storage_service.delete_dream, dream_id, owner=owner)
     if not success:
         raise HTTPException(status_code=404, detail="Dream not found")
     return {"message": "Dream deleted"}
 
+# Journal entries and milestones are changed one at a time: each write logs
+# only the affected item, however many the dream already has.
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _item_response(item, status_code: int = 200) -> Response:
+    return Response(content=item.model_dump_json(), media_type="application/json", status_code=status_code)
+
+@app.post("/dreams/{dream_id}/journal", response_model=JournalEntry, status_code=201)
+async def add_journal_entry(dream_id: str, entry: JournalEntryInput, owner: Optional[str] = Depends(get_owner)):
+    item = {"content": entry.content, "created_at": entry.created_at or _now()}
+    if entry.id:
+        item["id"] = entry.id
+    saved = await storage_pool.run(storage_service.put_item, dream_id, "journal_entries", item, owner=owner)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Dream not found")
+    return _item_response(saved, status_code=201)
+
+@app.patch("/dreams/{dream_id}/journal/{entry_id}", response_model=JournalEntry)
+async def update_journal_entry(dream_id: str, entry_id: str, updates: JournalEntryUpdate,
+                               owner: Optional[str] = Depends(get_owner)):
+    fields = updates.model_dump(exclude_unset=True)
+    fields.setdefault("updated_at", _now())
+    saved = await storage_pool.run(storage_service.update_item, dream_id, "journal_entries", entry_id, fields, owner=owner)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Journal entry not found")
+    return _item_response(saved)
+
+@app.delete("/dreams/{dream_id}/journal/{entry_id}")
+async def delete_journal_entry(dream_id: str, entry_id: str, owner: Optional[str] = Depends(get_owner)):
+    success = await storage_pool.run(storage_service.delete_item, dream_id, "journal_entries", entry_id, owner=owner)
+    if not success:
+        raise HTTPException(status_code=404, detail="Journal entry not found")
+    return {"message": "Journal entry deleted"}
+
+@app.post("/dreams/{dream_id}/milestones", response_model=Milestone, status_code=201)
+async def add_milestone(dream_id: str, milestone: Milestone, owner: Optional[str] = Depends(get_owner)):
+    saved = await storage_pool.run(
+        storage_service.put_item, dream_id, "milestones", milestone.model_dump(), owner=owner
+    )
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Dream not found")
+    return _item_response(saved, status_code=201)
+
+@app.patch("/dreams/{dream_id}/milestones/{milestone_id}", response_model=Milestone)
+async def update_milestone(dream_id: str, milestone_id: str, updates: MilestoneUpdate,
+                           owner: Optional[str] = Depends(get_owner)):
+    saved = await storage_pool.run(
+        storage_service.update_item, dream_id, "milestones", milestone_id,
+        updates.model_dump(exclude_unset=True), owner=owner
+    )
+    if saved is None:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    return _item_response(saved)
+
+@app.delete("/dreams/{dream_id}/milestones/{milestone_id}")
+async def delete_milestone(dream_id: str, milestone_id: str, owner: Optional[str] = Depends(get_owner)):
+    success = await storage_pool.run(storage_service.delete_item, dream_id, "milestones", milestone_id, owner=owner)
+    if not success:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    return {"message": "Milestone deleted"}
+
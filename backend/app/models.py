@@ -48,6 +48,8 @@ class DreamEntry(BaseModel):
     milestones: List[Milestone] = Field(default_factory=list)
     journal_entries: List[JournalEntry] = Field(default_factory=list)
     notes: Optional[str] = None
+    # Set when the dream was saved or suggested while looking like an existing one
+    duplicate_of: Optional[str] = None
 
 
 class DreamCollection(BaseModel):
@@ -65,3 +67,23 @@ class DreamUpdate(BaseModel):
     journal_entries: Optional[List[JournalEntry]] = None
     notes: Optional[str] = None
 
+
+class JournalEntryInput(BaseModel):
+    # Clients may send their own id so a retried request upserts instead of duplicating
+    id: Optional[str] = None
+    content: str
+    created_at: Optional[str] = None
+
+class JournalEntryUpdate(BaseModel):
+    content: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class MilestoneUpdate(BaseModel):
+    title: Optional[str] = None
+    target_year: Optional[int] = None
+    completed: Optional[bool] = None
+
+
+class PolishBatchRequest(BaseModel):
+    dream_ids: List[str] = Field(description="Dreams to polish in one request")
+    fresh: bool = False
@@ -2,27 +2,81 @@ import re
 from ..models import DreamInput, DreamCollection, DreamEntry, SMARTGoal, Milestone
 import os
 import json
+import time
 from dotenv import load_dotenv
-from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Optional
+from pydantic import ValidationError
+from .llm_cache import cache_from_env
+from .output_repair import DreamOutputRepair
+from .json_stream import JSONObjectStreamParser
+from .llm_dispatcher import dispatcher_from_env
+from .metrics import metrics
 
 load_dotenv()
 
+
+def _record_llm_call(kind: str, started: float, message: Any = None, chunks: int = 0):
+    """Latency, tokens and tokens/second of one completed LLM call.
+
+    Token counts come from the usage the provider reports (Ollama's eval_count);
+    for streams without usage, every chunk is counted as one token.
+    """
+    elapsed = time.perf_counter() - started
+    metrics.observe("llm_request_seconds", elapsed, kind=kind)
+    usage = getattr(message, "usage_metadata", None) or {}
+    response = getattr(message, "response_metadata", None) or {}
+    tokens = usage.get("output_tokens") or response.get("eval_count") or chunks
+    if not tokens:
+        return
+    metrics.inc("llm_tokens_total", tokens, kind=kind)
+    # Ollama reports pure generation time, without prompt evaluation and queuing
+    generation_seconds = response.get("eval_duration", 0) / 1e9 or elapsed
+    metrics.observe("llm_tokens_per_second", tokens / generation_seconds, kind=kind)
+
 class AnalysisService:
     def __init__(self):
         self.model_name = os.getenv("OLLAMA_MODEL", "llama3")
         self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-        
-        self.llm = ChatOllama(
-            model=self.model_name,
-            base_url=self.base_url,
-            temperature=0.7
-        )
-
-    async def analyze_dreams(self, input_data: DreamInput) -> DreamCollection:
-        parser = JsonOutputParser(pydantic_object=DreamCollection)
+        self.temperature = 0.7
+        # The client is built on first use so importing the app stays cheap
+        self._llm = None
+        self.cache = cache_from_env()
+        self.repair = DreamOutputRepair()
+        self.dispatcher = dispatcher_from_env()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_ollama import ChatOllama
+            self._llm = ChatOllama(
+                model=self.model_name,
+                base_url=self.base_url,
+                temperature=self.temperature
+            )
+        return self._llm
+
+    @property
+    def ready(self) -> bool:
+        return self._llm is not None
+
+    def _cache_key(self, kind: str, prompt_input: str) -> str:
+        return self.cache.make_key(kind, prompt_input, self.model_name, self.temperature)
+
+    async def analyze_dreams(self, input_data: DreamInput, use_cache: bool = True) -> DreamCollection:
+        cache_key = self._cache_key("analyze", input_data.text)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return DreamCollection(**cached)
+
+        result = await self.dispatcher.run("analyze", cache_key, lambda: self._analyze_dreams(input_data))
+        # Ids are left out so every cache hit (or deduplicated caller) still gets fresh dream ids
+        payload = result.model_dump(mode="json", exclude={"dreams": {"__all__": {"id"}}})
+        self.cache.set(cache_key, payload)
+        return DreamCollection(**payload)
+
+    async def _analyze_dreams(self, input_data: DreamInput) -> DreamCollection:
         prompt = ChatPromptTemplate.from_messages([
             ("system", """
             You are an expert life coach. Extract distinct dreams/goals from the user's text.
@@ -45,93 +99,38 @@ class AnalysisService:
             """),
             ("user", "{text}")
         ])
-        chain = prompt | self.llm | parser
+        # One LLM call; the raw completion goes through the repair chain instead of a second run
+        chain = prompt | self.llm
+        started = time.perf_counter()
         try:
-            result = await chain.ainvoke({"text": input_data.text})
-            return DreamCollection(**result)
+            raw_result = await chain.ainvoke({"text": input_data.text})
+            _record_llm_call("analyze", started, raw_result)
         except Exception as e:
+            metrics.inc("llm_errors_total", kind="analyze")
             # Check if it's a connection error
             error_str = str(e).lower()
             if "connection" in error_str or "refused" in error_str or "timeout" in error_str:
                 raise ConnectionError(f"Cannot connect to Ollama at {self.base_url}. Please make sure Ollama is running and the model '{self.model_name}' is available.")
-            # Try to handle malformed LLM output
-            try:
-                # Get raw output and try to transform it
-                raw_chain = prompt | self.llm
-                raw_result = await raw_chain.ainvoke({"text": input_data.text})
-                content = str(raw_result.content) if hasattr(raw_result, 'content') else str(raw_result)
-                content = content.strip()
-                
-                # Remove markdown code blocks if present
-                if content.startswith("```"):
-                    content = re.sub(r'^```(?:json)?\s*', '', content)
-                    content = re.sub(r'\s*```$', '', content)
-                
-                try:
-                    data = json.loads(content)
-                except json.JSONDecodeError:
-                    raise ValueError("LLM returned invalid JSON. Please try rephrasing your input.")
-                
-                # Handle case where LLM returns dreams grouped by category
-                if "dreams" not in data and isinstance(data, dict):
-                    dreams_list = []
-                    for category, items in data.items():
-                        if isinstance(items, list):
-                            for item in items:
-                                if isinstance(item, dict):
-                                    # Normalize the item
-                                    dream = {
-                                        "title": item.get("title", item.get("Title", "")),
-                                        "category": category if category in ["Career & Business", "Finance & Wealth", "Health & Wellness", 
-                                                                           "Relationships & Family", "Travel & Adventure", 
-                                                                           "Skills & Knowledge", "Lifestyle & Hobbies", "Other"] 
-                                                          else "Other",
-                                        "suggested_target_year": item.get("suggested_target_year", 
-                                                                          item.get("target_year", 
-                                                                                  item.get("Target Year", 
-                                                                                          item.get("year", 2026))))
-                                    }
-                                    if dream["title"]:
-                                        dreams_list.append(dream)
-                    data = {"dreams": dreams_list}
-                
-                # Handle case where data is already a list
-                if isinstance(data, list):
-                    data = {"dreams": data}
-                
-                # Ensure all dreams have required fields
-                if "dreams" in data:
-                    valid_dreams = []
-                    for dream in data["dreams"]:
-                        if not isinstance(dream, dict):
-                            continue
-                        # Normalize field names
-                        if "Title" in dream:
-                            dream["title"] = dream.pop("Title")
-                        if "target_year" in dream or "Target Year" in dream:
-                            dream["suggested_target_year"] = dream.pop("target_year", dream.pop("Target Year", 2026))
-                        if "Category" in dream:
-                            dream["category"] = dream.pop("Category")
-                        if "suggested_target_year" not in dream:
-                            dream["suggested_target_year"] = 2026
-                        if "category" not in dream:
-                            dream["category"] = "Other"
-                        # Ensure title exists
-                        if "title" in dream and dream["title"]:
-                            valid_dreams.append(dream)
-                    
-                    if not valid_dreams:
-                        raise ValueError("No valid dreams found in the AI response. Please try rephrasing your input with more specific goals.")
-                    
-                    data["dreams"] = valid_dreams
-                else:
-                    raise ValueError("AI response missing 'dreams' field. Please try rephrasing your input.")
-                
-                return DreamCollection(**data)
-            except Exception as fix_error:
-                raise ValueError("Unable to parse dream analysis. Please try rephrasing your input.")
-
-    async def polish_dream(self, dream_title: str) -> SMARTGoal:
+            raise
+
+        content = str(raw_result.content) if hasattr(raw_result, 'content') else str(raw_result)
+        return self.repair.repair(content)
+
+    async def polish_dream(self, dream_title: str, use_cache: bool = True, endpoint: str = "polish") -> SMARTGoal:
+        cache_key = self._cache_key("polish", dream_title)
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return SMARTGoal(**cached)
+
+        smart_goal = await self.dispatcher.run(endpoint, cache_key, lambda: self._polish_dream(dream_title))
+        if smart_goal is None:
+            return SMARTGoal(polished_title=dream_title)
+        # Only real answers are cached; fallbacks should be retried next time
+        self.cache.set(cache_key, smart_goal.model_dump())
+        return smart_goal
+
+    async def _polish_dream(self, dream_title: str) -> Optional[SMARTGoal]:
         prompt = ChatPromptTemplate.from_messages([
             ("system", """
             You are a master life strategist. Transform the user's dream into a comprehensive SMART goal.
@@ -151,7 +150,13 @@ class AnalysisService:
         ])
         chain = prompt | self.llm
         try:
-            raw_result = await chain.ainvoke({"title": dream_title})
+            started = time.perf_counter()
+            try:
+                raw_result = await chain.ainvoke({"title": dream_title})
+            except Exception:
+                metrics.inc("llm_errors_total", kind="polish")
+                raise
+            _record_llm_call("polish", started, raw_result)
             content = str(raw_result.content) if hasattr(raw_result, 'content') else str(raw_result)
             content = content.strip()
             
@@ -160,7 +165,7 @@ class AnalysisService:
             json_match = re.search(r'\{[\s\S]*', content)
             if not json_match:
                 print(f"No JSON start found in: {content}")
-                return SMARTGoal(polished_title=dream_title)
+                return None
             
             json_str = json_match.group()
             
@@ -176,7 +181,7 @@ class AnalysisService:
             data = try_parse_json(json_str)
             if not data:
                 print(f"Failed to parse JSON even with fixes: {json_str}")
-                return SMARTGoal(polished_title=dream_title)
+                return None
             
             # Handle potential case-insensitivity from LLM
             normalized = {}
@@ -196,9 +201,10 @@ class AnalysisService:
             return SMARTGoal(**mappings)
         except Exception as e:
             print(f"Failed to polish dream: {e}")
-            return SMARTGoal(polished_title=dream_title)
+            return None
 
-    async def generate_roadmap(self, dream: DreamEntry, user_age: int = 30) -> AsyncGenerator[str, None]:
+    async def generate_roadmap(self, dream: DreamEntry, user_age: int = 30) -> AsyncGenerator[Milestone, None]:
+        """Stream validated milestones, each as soon as the LLM closes its JSON object."""
         prompt = ChatPromptTemplate.from_messages([
             ("system", """
             You are a strategic career and life planner. Generate a roadmap of 3-5 concrete milestones for the following dream.
@@ -215,12 +221,31 @@ class AnalysisService:
             ("user", "Dream: {title} (Overall Target Year: {year})")
         ])
         
-        # We use astream to get chunks
-        async for chunk in self.llm.astream(prompt.format(
-            title=dream.title, 
-            year=dream.suggested_target_year, 
-            age=user_age
-        )):
-            yield chunk.content
+        parser = JSONObjectStreamParser()
+        # The slot is held for the whole stream; we use astream to get chunks
+        async with self.dispatcher.slot("roadmap"):
+            started = time.perf_counter()
+            chunks, last_chunk = 0, None
+            try:
+                async for chunk in self.llm.astream(prompt.format(
+                    title=dream.title,
+                    year=dream.suggested_target_year,
+                    age=user_age
+                )):
+                    if chunks == 0:
+                        metrics.observe("llm_time_to_first_token_seconds", time.perf_counter() - started, kind="roadmap")
+                    chunks += 1
+                    last_chunk = chunk
+                    for obj in parser.feed(str(chunk.content)):
+                        # LLM ids are often slugs like "m1"; milestones need globally unique ids
+                        obj.pop("id", None)
+                        try:
+                            yield Milestone(**obj)
+                        except ValidationError:
+                            print(f"Skipping invalid roadmap milestone: {obj}")
+            except Exception:
+                metrics.inc("llm_errors_total", kind="roadmap")
+                raise
+            _record_llm_call("roadmap", started, last_chunk, chunks)
 
 analysis_service = AnalysisService()
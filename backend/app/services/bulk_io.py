@@ -0,0 +1,105 @@
+"""Streaming NDJSON export and import of dreams, one record per line.
+
+Both directions work in bounded pieces, so memory does not grow with the
+number of records: exports are read page by page through the storage
+cursor, imports are validated and saved `IMPORT_BATCH_SIZE` lines at a time
+(one group commit per batch). After every batch an import writes a
+checkpoint; running it again with the same checkpoint skips the lines that
+are already saved, so an interrupted import resumes instead of duplicating.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import ValidationError
+
+from ..models import DreamEntry
+from .migrations import upgrade
+from .storage_service import OWNER_PATTERN, owner_path, storage_service
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+# Lines longer than this are rejected instead of buffered
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+MAX_REPORTED_ERRORS = 20
+
+
+def import_checkpoint_path(owner: Optional[str], import_id: str) -> Path:
+    """Where the API keeps the checkpoint of a client-named import."""
+    # The id becomes a file name, so it gets the same rules as owner keys
+    if not OWNER_PATTERN.match(import_id):
+        raise ValueError(f"Invalid import id {import_id!r}")
+    return owner_path(owner, "imports") / f"{import_id}.json"
+
+
+class NDJSONImporter:
+    """Validates NDJSON dream lines and saves them in batches, checkpointing after each."""
+
+    def __init__(self, owner: Optional[str] = None, checkpoint: Optional[Path] = None):
+        self.owner = owner
+        self.checkpoint = checkpoint
+        self.state: Dict[str, Any] = {"lines": 0, "imported": 0, "failed": 0, "errors": [], "done": False}
+        if checkpoint is not None and checkpoint.exists():
+            with open(checkpoint) as f:
+                self.state.update(json.load(f))
+        self.resumed_from = self.state["lines"]
+        self._line = 0
+
+    def _parse(self, line: bytes) -> Optional[DreamEntry]:
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            # Exports of older versions are upgraded like stored records
+            return DreamEntry(**upgrade(record))
+        except (ValueError, ValidationError) as e:
+            self.state["failed"] += 1
+            if len(self.state["errors"]) < MAX_REPORTED_ERRORS:
+                self.state["errors"].append({"line": self._line, "error": str(e)[:300]})
+            return None
+
+    def write_batch(self, lines: List[bytes]):
+        """Validate and save one batch of lines. Blocking: run it off the event loop."""
+        entries = []
+        for line in lines:
+            self._line += 1
+            # Lines up to the checkpoint were saved by an earlier run
+            if self._line <= self.state["lines"] or not line.strip():
+                continue
+            entry = self._parse(line)
+            if entry is not None:
+                entries.append(entry)
+        if entries:
+            storage_service.save_dreams(entries, owner=self.owner)
+        self.state["imported"] += len(entries)
+        self.state["lines"] = max(self.state["lines"], self._line)
+        self._save_checkpoint()
+
+    def finish(self) -> Dict[str, Any]:
+        self.state["done"] = True
+        self._save_checkpoint()
+        return {**self.state, "resumed_from_line": self.resumed_from}
+
+    def _save_checkpoint(self):
+        if self.checkpoint is None:
+            return
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.checkpoint)
+
+
+def import_lines(lines: Iterable[bytes], owner: Optional[str] = None, checkpoint: Optional[Path] = None,
+                 batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """Import NDJSON lines from any iterable (e.g. an open file) in batches."""
+    importer = NDJSONImporter(owner, checkpoint)
+    batch: List[bytes] = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            importer.write_batch(batch)
+            batch = []
+    importer.write_batch(batch)
+    return importer.finish()
@@ -0,0 +1,101 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..models import DreamCategory
+
+Change = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def _category(record: Dict[str, Any]) -> str:
+    value = record.get("category") or DreamCategory.OTHER.value
+    # Records coming straight from model_dump() still hold DreamCategory members
+    return str(getattr(value, "value", value))
+
+
+def _year(record: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(record["suggested_target_year"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _milestone_completed(milestone: Any) -> bool:
+    return bool(milestone.get("completed") if isinstance(milestone, dict) else getattr(milestone, "completed", False))
+
+
+def _rate(completed: int, total: int) -> float:
+    return completed / total if total else 0.0
+
+
+class DreamStats:
+    """Dashboard aggregates of one owner's dreams, kept up to date change by change.
+
+    Every write adjusts the counters by the difference between the old and
+    the new record, so reading them costs the same however many dreams there
+    are; only loading the shard walks every record once.
+    """
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()):
+        self.total = 0
+        self.completed = 0
+        self.polished = 0
+        self.categories: Counter = Counter()
+        self.categories_completed: Counter = Counter()
+        self.years: Counter = Counter()
+        self.years_completed: Counter = Counter()
+        self.milestones = 0
+        self.milestones_completed = 0
+        for record in records:
+            self._count(record, 1)
+
+    def _count(self, record: Dict[str, Any], sign: int):
+        completed = bool(record.get("completed"))
+        category = _category(record)
+        year = _year(record)
+        milestones = record.get("milestones") or []
+
+        self.total += sign
+        self.completed += sign * completed
+        self.polished += sign * bool(record.get("is_polished"))
+        self.categories[category] += sign
+        self.categories_completed[category] += sign * completed
+        if year is not None:
+            self.years[year] += sign
+            self.years_completed[year] += sign * completed
+        self.milestones += sign * len(milestones)
+        self.milestones_completed += sign * sum(1 for m in milestones if _milestone_completed(m))
+
+    def apply(self, changes: List[Change]):
+        for old_raw, new_raw in changes:
+            if old_raw is not None:
+                self._count(old_raw, -1)
+            if new_raw is not None:
+                self._count(new_raw, 1)
+
+    def as_dict(self) -> Dict[str, Any]:
+        # Every category is listed, even empty ones, so charts keep a stable shape
+        known = [c.value for c in DreamCategory]
+        names = known + sorted(name for name, count in self.categories.items() if count and name not in known)
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "completion_rate": _rate(self.completed, self.total),
+            "polished": self.polished,
+            "categories": {
+                name: {
+                    "total": self.categories[name],
+                    "completed": self.categories_completed[name],
+                    "completion_rate": _rate(self.categories_completed[name], self.categories[name]),
+                }
+                for name in names
+            },
+            "target_years": {
+                str(year): {"total": self.years[year], "completed": self.years_completed[year]}
+                for year in sorted(self.years) if self.years[year]
+            },
+            "milestones": {
+                "total": self.milestones,
+                "completed": self.milestones_completed,
+                "completion_rate": _rate(self.milestones_completed, self.milestones),
+            },
+        }
@@ -0,0 +1,330 @@
+"""Shared embedding service for multi-worker deployments.
+
+Run one per host next to the API workers:
+
+    EMBEDDING_SERVICE_ADDRESS=unix:data/embedding.sock python -m app.services.embedding_server
+
+and start the workers with the same EMBEDDING_SERVICE_ADDRESS. The service
+owns the only SentenceTransformer copy: `encode` requests from every worker
+are micro-batched into one model call, and the embedding matrix it keeps in
+sync with storage is published to shared memory, where workers map it
+read-only without copying. Only the default owner's matrix is shared; the
+per-owner partitions of other users are kept by each worker, which still
+encodes through the service.
+
+Connections exchange pickles, so every one is authenticated. On a unix
+socket the service generates a fresh key at startup and writes it next to
+the socket, readable only by its user; over TCP, EMBEDDING_SERVICE_AUTHKEY
+must be set, to the same secret, for the service and every worker.
+"""
+import numpy as np
+import os
+import queue
+import secrets
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .embedding_store import DTYPES, EmbeddingStore
+
+AUTHKEY = os.getenv("EMBEDDING_SERVICE_AUTHKEY", "").encode("utf-8")
+SHM_PREFIX = os.getenv("EMBEDDING_SHM_PREFIX", "mydreams_emb")
+BATCH_WINDOW = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+BATCH_MAX_TEXTS = int(os.getenv("EMBEDDING_BATCH_MAX_TEXTS", "256"))
+PUBLISH_INTERVAL = float(os.getenv("EMBEDDING_PUBLISH_INTERVAL", "0.5"))
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """`unix:/path/to.sock` or `host:port`."""
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def require_authkey(address: Union[str, Tuple[str, int]]):
+    """Refuse TCP without a configured key: whoever can connect could run code in the peer."""
+    if not AUTHKEY and not isinstance(address, str):
+        raise ValueError("EMBEDDING_SERVICE_AUTHKEY must be set to use the embedding service over TCP")
+
+
+def socket_key_path(socket_path: str) -> str:
+    return socket_path + ".key"
+
+
+def attach_shared_memory(name: str) -> SharedMemory:
+    # Readers must not let the resource tracker unlink the server's segments at exit
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class EmbeddingServer:
+    def __init__(self, address: str, search):
+        self.address = parse_address(address)
+        require_authkey(self.address)
+        self.search = search
+        self._requests: "queue.Queue[Tuple[Any, threading.Lock, int, List[str]]]" = queue.Queue()
+        self._header = SharedMemory(name=f"{SHM_PREFIX}_header", create=True, size=8)
+        self._generation = 0
+        self._segment: Optional[SharedMemory] = None
+        self._snapshot: Dict[str, Any] = {}
+        self._published_version = -1
+        self.batches = 0
+        self.encoded_texts = 0
+
+    def serve_forever(self):
+        self.search.warm_up()
+        self._publish()
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        threading.Thread(target=self._publish_loop, name="embedding-publisher", daemon=True).start()
+
+        authkey = AUTHKEY
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            if not authkey:
+                authkey = self._write_socket_key()
+        with Listener(self.address, authkey=authkey) as listener:
+            print(f"Embedding service listening on {self.address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _write_socket_key(self) -> bytes:
+        """A new random key for this run, in a file only our user can read."""
+        key = secrets.token_hex(32)
+        path = socket_key_path(self.address)
+        if os.path.exists(path):
+            os.unlink(path)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+        return key.encode("utf-8")
+
+    def close(self):
+        for shm in (self._segment, self._header):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+        try:
+            while True:
+                message = conn.recv()
+                kind = message[0]
+                if kind == "encode":
+                    _, request_id, texts = message
+                    self._requests.put((conn, send_lock, request_id, texts))
+                elif kind == "snapshot":
+                    with send_lock:
+                        conn.send(("snapshot", message[1], self._snapshot))
+                elif kind == "stats":
+                    with send_lock:
+                        conn.send(("stats", message[1], {"batches": self.batches, "encoded_texts": self.encoded_texts,
+                                                         "generation": self._generation}))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            total = len(batch[0][3])
+            deadline = time.monotonic() + BATCH_WINDOW
+            while total < BATCH_MAX_TEXTS:
+                try:
+                    item = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(item)
+                total += len(item[3])
+
+            texts = [text for _, _, _, item_texts in batch for text in item_texts]
+            try:
+                vectors = np.asarray(self.search.model.encode(texts), dtype=np.float32)
+                error = None
+            except Exception as e:
+                vectors, error = None, str(e)
+            self.batches += 1
+            self.encoded_texts += len(texts)
+
+            offset = 0
+            for conn, send_lock, request_id, item_texts in batch:
+                reply = ("error", request_id, error) if error else \
+                    ("encoded", request_id, vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+                try:
+                    with send_lock:
+                        conn.send(reply)
+                except (EOFError, OSError):
+                    pass
+
+    def _publish_loop(self):
+        while True:
+            time.sleep(PUBLISH_INTERVAL)
+            try:
+                # Tails the storage log, which updates the store through the storage listener
+                self.search.refresh()
+                self._publish()
+            except Exception as e:
+                print(f"Failed to publish embeddings: {e}")
+
+    def _publish(self):
+        """Copy the store into a fresh shared-memory segment if it changed."""
+        with self.search._lock:
+            store = self.search.store
+            if store.version == self._published_version:
+                return
+            matrix = store.matrix
+            generation = self._generation + 1
+            segment = SharedMemory(name=f"{SHM_PREFIX}_{generation}", create=True, size=max(matrix.nbytes, 1))
+            np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=segment.buf)[:] = matrix
+            snapshot = {
+                "generation": generation,
+                "segment": segment.name,
+                "shape": matrix.shape,
+                "dtype": store.dtype_name,
+                "scales": store.scales.copy(),
+                "ids": list(store.ids),
+                "categories": list(store.categories),
+                "category_codes": store.category_codes.copy(),
+                "years": store.years.copy(),
+            }
+            self._published_version = store.version
+
+        previous = self._segment
+        self._segment, self._snapshot, self._generation = segment, snapshot, generation
+        np.ndarray((1,), dtype=np.int64, buffer=self._header.buf)[0] = generation
+        if previous is not None:
+            # Workers that already mapped it keep their mapping; new readers use the new one
+            previous.close()
+            previous.unlink()
+
+
+class EmbeddingClient:
+    """Worker-side connection to the embedding service."""
+
+    def __init__(self, address: str):
+        self.address = parse_address(address)
+        require_authkey(self.address)
+        self._conn = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._header: Optional[SharedMemory] = None
+
+    def _request(self, kind: str, *payload) -> Any:
+        with self._lock:
+            if self._conn is None:
+                self._conn = Client(self.address, authkey=self._authkey())
+            self._next_id += 1
+            try:
+                self._conn.send((kind, self._next_id, *payload))
+                reply = self._conn.recv()
+            except (EOFError, OSError):
+                # Service restarted: reconnect on the next call
+                self._conn = None
+                raise ConnectionError(f"Embedding service at {self.address} is unavailable")
+        if reply[0] == "error":
+            raise RuntimeError(f"Embedding service failed: {reply[2]}")
+        return reply[2]
+
+    def _authkey(self) -> bytes:
+        if AUTHKEY:
+            return AUTHKEY
+        try:
+            # Rewritten by every service start, so read it again on each connect
+            with open(socket_key_path(self.address)) as f:
+                return f.read().strip().encode("utf-8")
+        except FileNotFoundError:
+            raise ConnectionError(f"Embedding service at {self.address} is unavailable")
+
+    def encode(self, texts: Union[str, List[str]], **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self._request("encode", [texts])[0]
+        return self._request("encode", list(texts))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self._request("snapshot")
+
+    def stats(self) -> Dict[str, Any]:
+        return self._request("stats")
+
+    def generation(self) -> int:
+        if self._header is None:
+            self._header = attach_shared_memory(f"{SHM_PREFIX}_header")
+        return int(np.ndarray((1,), dtype=np.int64, buffer=self._header.buf)[0])
+
+
+class SharedEmbeddingView(EmbeddingStore):
+    """Read-only EmbeddingStore backed by the service's shared-memory matrix."""
+
+    def __init__(self, client: EmbeddingClient, model_name: str = ""):
+        super().__init__(model_name=model_name)
+        # Float32 vectors for re-ranking stay with the service; scores here are dequantized
+        self.rerank_candidates = 0
+        self.client = client
+        self.generation = 0
+        self._segment: Optional[SharedMemory] = None
+        self._retired: List[SharedMemory] = []
+
+    def refresh(self):
+        if self.client.generation() == self.generation:
+            return
+        snapshot = self.client.snapshot()
+        segment = attach_shared_memory(snapshot["segment"])
+        self.dtype_name = snapshot["dtype"]
+        self.dtype = DTYPES[self.dtype_name]
+        self.quantized = self.dtype is not np.float32
+        self._matrix = np.ndarray(snapshot["shape"], dtype=self.dtype, buffer=segment.buf)
+        self._scales = snapshot["scales"]
+        self.ids = snapshot["ids"]
+        self._rows = {dream_id: i for i, dream_id in enumerate(self.ids)}
+        self.categories = snapshot["categories"]
+        self._category_codes = snapshot["category_codes"]
+        self._years = snapshot["years"]
+        self.generation = snapshot["generation"]
+
+        if self._segment is not None:
+            self._retired.append(self._segment)
+        self._segment = segment
+        # Searches still holding views of an older segment keep it alive until they finish
+        still_used = []
+        for old in self._retired:
+            try:
+                old.close()
+            except BufferError:
+                still_used.append(old)
+        self._retired = still_used
+
+    def load(self) -> bool:
+        self.refresh()
+        return True
+
+    def save(self):
+        pass
+
+
+def main():
+    from .search_service import SearchService
+
+    address = os.getenv("EMBEDDING_SERVICE_ADDRESS", "unix:data/embedding.sock")
+    server = EmbeddingServer(address, SearchService())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
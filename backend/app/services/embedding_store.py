@@ -0,0 +1,345 @@
+import numpy as np
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable
+
+EMBEDDINGS_FILE = Path("data/embeddings.npz")
+# Bumped whenever the persisted layout changes; older files are rebuilt from storage
+STORE_FORMAT = 3
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+# Scores are dequantized in blocks so a full scan never materializes a float32 copy
+SCORE_BLOCK_ROWS = 65536
+
+
+def content_hash(title: str, category: str) -> str:
+    # Only title and category feed the embedding text, so only they invalidate a vector
+    return hashlib.sha1(f"{title}\x1f{category}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Unit-normalized dream embeddings kept as one NumPy matrix, with a row per dream id.
+
+    Category and target year are kept alongside each row so searches can
+    filter with a boolean mask before ranking.
+
+    EMBEDDINGS_DTYPE picks how rows are held in memory and on disk:
+    float32 (exact), float16 (half the size; scores within ~1e-3 of float32)
+    or int8 (a quarter of the size, scalar-quantized with one scale per row;
+    scores within ~1e-2 of float32). For the quantized types the float32
+    vectors are also kept in a memory-mapped sidecar file, and the best
+    EMBEDDINGS_RERANK candidates of a search are re-scored from it, so the
+    returned scores are exact float32 cosines.
+
+    The matrix is saved as its own .npy file next to the metadata in `path`
+    and memory-mapped (copy-on-write) on load, so only the pages a search
+    touches are read in.
+    """
+
+    def __init__(self, path: Path = EMBEDDINGS_FILE, model_name: str = "", dtype: Optional[str] = None):
+        self.path = path
+        self.model_name = model_name
+        self.save_interval = float(os.getenv("EMBEDDINGS_SAVE_INTERVAL", "5"))
+        self.dtype_name = dtype or os.getenv("EMBEDDINGS_DTYPE", "float32")
+        if self.dtype_name not in DTYPES:
+            raise ValueError(f"Unsupported EMBEDDINGS_DTYPE {self.dtype_name!r}; expected one of {list(DTYPES)}")
+        self.dtype = DTYPES[self.dtype_name]
+        self.quantized = self.dtype is not np.float32
+        self.rerank_candidates = int(os.getenv("EMBEDDINGS_RERANK", "50")) if self.quantized else 0
+        self.ids: List[str] = []
+        self.hashes: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        # int8 only: per-row dequantization scale
+        self._scales = np.zeros(0, dtype=np.float32)
+        # float32 vectors for re-ranking: the sidecar from the last save, plus rows written since
+        self._exact: Optional[np.ndarray] = None
+        self._exact_rows: Dict[str, int] = {}
+        self._pending_exact: Dict[str, np.ndarray] = {}
+        self._category_codes = np.zeros(0, dtype=np.int16)
+        self._years = np.zeros(0, dtype=np.int32)
+        self.categories: List[str] = []
+        self._dirty = False
+        self._last_save = 0.0
+        # Bumped on every change so readers (e.g. the shared embedding service) can tell
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, dream_id: str) -> bool:
+        return dream_id in self._rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The stored rows, in the configured dtype. Use vectors()/score() for float32 values."""
+        if self._matrix is None:
+            return np.zeros((0, 0), dtype=self.dtype)
+        return self._matrix[:len(self.ids)]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self._scales[:len(self.ids)]
+
+    def vectors(self, rows) -> np.ndarray:
+        """Float32 (dequantized) vectors of the given rows."""
+        vectors = self.matrix[rows].astype(np.float32)
+        if self.dtype is np.int8:
+            vectors *= self.scales[rows][..., None]
+        return vectors
+
+    def score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine scores of a unit query against all rows, or just `rows`."""
+        query = np.asarray(query, dtype=np.float32)
+        if not self.quantized:
+            matrix = self.matrix
+            return matrix @ query if rows is None else matrix[rows] @ query
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = self.vectors(block) @ query
+        return scores
+
+    def exact_vector(self, dream_id: str) -> Optional[np.ndarray]:
+        vector = self._pending_exact.get(dream_id)
+        if vector is None and dream_id in self._exact_rows:
+            vector = self._exact[self._exact_rows[dream_id]]
+        return vector
+
+    def exact_scores(self, rows: np.ndarray, query: np.ndarray) -> Optional[np.ndarray]:
+        """Float32 scores for re-ranking, or None when some row has no exact vector."""
+        vectors = [self.exact_vector(self.ids[row]) for row in rows]
+        if any(v is None for v in vectors):
+            return None
+        if not vectors:
+            return np.zeros(0, dtype=np.float32)
+        return np.asarray(vectors, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+
+    @property
+    def years(self) -> np.ndarray:
+        return self._years[:len(self.ids)]
+
+    @property
+    def category_codes(self) -> np.ndarray:
+        return self._category_codes[:len(self.ids)]
+
+    def row(self, dream_id: str) -> Optional[int]:
+        return self._rows.get(dream_id)
+
+    def hash_of(self, dream_id: str) -> Optional[str]:
+        row = self._rows.get(dream_id)
+        return self.hashes[row] if row is not None else None
+
+    def _sidecar(self, token: str, kind: str) -> Path:
+        # Each save writes fresh sidecars and the metadata file names them, so a
+        # crash mid-save leaves the previous, consistent set in place
+        return self.path.with_name(f"{self.path.stem}.{token}.{kind}.npy")
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["format"]) != STORE_FORMAT or str(data["model_name"]) != self.model_name \
+                        or str(data["dtype"]) != self.dtype_name:
+                    print(f"Discarding outdated embeddings in {self.path}")
+                    return False
+                token = str(data["token"])
+                ids = [str(i) for i in data["ids"]]
+                hashes = [str(h) for h in data["hashes"]]
+                categories = [str(c) for c in data["categories"]]
+                category_codes = data["category_codes"].astype(np.int16)
+                years = data["years"].astype(np.int32)
+                scales = data["scales"].astype(np.float32)
+            matrix = np.load(self._sidecar(token, "matrix"), mmap_mode="c")
+            exact = None
+            if self.quantized and self._sidecar(token, "exact").exists():
+                exact = np.load(self._sidecar(token, "exact"), mmap_mode="r")
+        except Exception as e:
+            print(f"Failed to load embeddings from {self.path}: {e}")
+            return False
+
+        self._matrix = matrix if ids else None
+        self._scales = scales
+        self._exact = exact
+        self._exact_rows = {dream_id: i for i, dream_id in enumerate(ids)} if exact is not None else {}
+        self._pending_exact = {}
+        self.ids = ids
+        self.hashes = hashes
+        self.categories = categories
+        self._category_codes = category_codes
+        self._years = years
+        self._rows = {dream_id: i for i, dream_id in enumerate(ids)}
+        self._last_save = time.monotonic()
+        self.version += 1
+        return True
+
+    def save(self):
+        if not self.path.parent.exists():
+            self.path.parent.mkdir(parents=True)
+        token = uuid.uuid4().hex[:12]
+        np.save(self._sidecar(token, "matrix"), self.matrix)
+        exact = None
+        if self.quantized:
+            exact = self._save_exact(self._sidecar(token, "exact"))
+
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                format=np.array(STORE_FORMAT),
+                model_name=np.array(self.model_name),
+                dtype=np.array(self.dtype_name),
+                token=np.array(token),
+                ids=np.array(self.ids, dtype=str),
+                hashes=np.array(self.hashes, dtype=str),
+                categories=np.array(self.categories, dtype=str),
+                category_codes=self.category_codes,
+                years=self.years,
+                scales=self.scales,
+            )
+        os.replace(tmp_path, self.path)
+        for stale in self.path.parent.glob(f"{self.path.stem}.*.npy"):
+            if f".{token}." not in stale.name:
+                stale.unlink()
+
+        if exact is not None:
+            self._exact = exact
+            self._exact_rows = {dream_id: i for i, dream_id in enumerate(self.ids)}
+            self._pending_exact = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+    def _save_exact(self, path: Path) -> Optional[np.ndarray]:
+        """Write the float32 sidecar in row order and map it back read-only."""
+        if not self.ids:
+            return None
+        exact = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(self.ids), self.dim))
+        sources = np.array([self._exact_rows.get(dream_id, -1) for dream_id in self.ids], dtype=np.int64)
+        for start in range(0, len(sources), SCORE_BLOCK_ROWS):
+            block = sources[start:start + SCORE_BLOCK_ROWS]
+            rows = np.arange(start, start + len(block))
+            known = block >= 0
+            if known.any():
+                exact[rows[known]] = self._exact[block[known]]
+            if not known.all():
+                # Rows loaded without a sidecar fall back to their dequantized value
+                exact[rows[~known]] = self.vectors(rows[~known])
+        for dream_id, vector in self._pending_exact.items():
+            exact[self._rows[dream_id]] = vector
+        exact.flush()
+        del exact
+        return np.load(path, mmap_mode="r")
+
+    def maybe_save(self):
+        # Rows are self-healing through their content hashes, so a crash between
+        # saves only costs re-encoding the dreams changed since the last one
+        if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+            return True
+        return False
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    def upsert(self, ids: List[str], hashes: List[str], vectors: np.ndarray,
+               categories: List[str], years: List[int]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        for dream_id, digest, vector in zip(ids, hashes, vectors):
+            row = self._rows.get(dream_id)
+            if row is None:
+                row = len(self.ids)
+                self._reserve(row + 1, vector.shape[0])
+                self.ids.append(dream_id)
+                self.hashes.append(digest)
+                self._rows[dream_id] = row
+            else:
+                self.hashes[row] = digest
+            self._set_row(row, vector)
+            if self.quantized:
+                self._pending_exact[dream_id] = vector
+        self.set_metadata(ids, categories, years)
+
+    def _set_row(self, row: int, vector: np.ndarray):
+        if self.dtype is np.int8:
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._matrix[row] = np.round(vector / scale).astype(np.int8)
+            self._scales[row] = scale
+        else:
+            self._matrix[row] = vector
+
+    def set_metadata(self, ids: List[str], categories: List[str], years: List[int]):
+        for dream_id, category, year in zip(ids, categories, years):
+            row = self._rows.get(dream_id)
+            if row is None:
+                continue
+            self._category_codes[row] = self._category_code(category)
+            self._years[row] = year
+        self._dirty = True
+        self.version += 1
+
+    def mask(self, category: Optional[str] = None, year: Optional[int] = None) -> Optional[np.ndarray]:
+        """Boolean row mask for the given filters, or None when nothing is filtered."""
+        if category is None and year is None:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category is not None:
+            if category not in self.categories:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= self.category_codes == self.categories.index(category)
+        if year is not None:
+            mask &= self.years == year
+        return mask
+
+    def _category_code(self, category: str) -> int:
+        if category not in self.categories:
+            self.categories.append(category)
+        return self.categories.index(category)
+
+    def remove(self, dream_ids: Iterable[str]):
+        for dream_id in dream_ids:
+            row = self._rows.pop(dream_id, None)
+            if row is None:
+                continue
+            # Swap the last row into the hole so the matrix stays dense
+            last = len(self.ids) - 1
+            self._pending_exact.pop(dream_id, None)
+            self._exact_rows.pop(dream_id, None)
+            if row != last:
+                moved = self.ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._scales[row] = self._scales[last]
+                self._category_codes[row] = self._category_codes[last]
+                self._years[row] = self._years[last]
+                self.ids[row] = moved
+                self.hashes[row] = self.hashes[last]
+                self._rows[moved] = row
+            self.ids.pop()
+            self.hashes.pop()
+            self._dirty = True
+            self.version += 1
+
+    def _reserve(self, size: int, dim: int):
+        if self._matrix is None:
+            self._matrix = np.zeros((max(size, 64), dim), dtype=self.dtype)
+        elif size > self._matrix.shape[0]:
+            grown = np.zeros((max(size, self._matrix.shape[0] * 2), dim), dtype=self.dtype)
+            grown[:len(self.ids)] = self._matrix[:len(self.ids)]
+            self._matrix = grown
+        capacity = self._matrix.shape[0]
+        if self._years.shape[0] < capacity:
+            self._category_codes = np.resize(self._category_codes, capacity)
+            self._years = np.resize(self._years, capacity)
+        if self._scales.shape[0] < capacity:
+            self._scales = np.resize(self._scales, capacity)
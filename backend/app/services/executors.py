@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a pool already has as many queued jobs as it is allowed to hold."""
+
+
+class BoundedExecutor:
+    """Thread pool for blocking work called from async handlers.
+
+    Keeps the event loop free for streaming and LLM-bound requests, caps how
+    much work may queue up behind the workers, and tracks queue depth.
+    """
+
+    def __init__(self, name: str, max_workers: int, queue_limit: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queued = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                raise PoolSaturatedError(f"{self.name} pool is saturated ({self.queued} jobs queued)")
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        # Cancelling the awaiting request cancels the job too, if no worker has picked it up yet
+        return await asyncio.wrap_future(self._queue(fn, args, kwargs))
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue background work from a plain thread (e.g. indexing after a storage write).
+
+        Never rejected, unlike run(): callers must coalesce what they queue.
+        """
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        return self._queue(fn, args, kwargs)
+
+    def _queue(self, fn: Callable[..., Any], args, kwargs) -> Future:
+        try:
+            future = self._pool.submit(self._job(fn, args, kwargs))
+        except RuntimeError:
+            # Shut down: the job was never queued
+            self._dequeue()
+            raise
+        # A job cancelled while queued never runs, so it can't take itself off the queue
+        future.add_done_callback(lambda f: self._dequeue() if f.cancelled() else None)
+        return future
+
+    def _dequeue(self):
+        with self._lock:
+            self.queued -= 1
+
+    def _job(self, fn: Callable[..., Any], args, kwargs) -> Callable[[], Any]:
+        def job():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "queue_limit": self.queue_limit,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def _pool_from_env(name: str, default_workers: int) -> BoundedExecutor:
+    prefix = name.upper()
+    workers = int(os.getenv(f"{prefix}_POOL_WORKERS", str(default_workers)))
+    queue_limit = int(os.getenv(f"{prefix}_POOL_QUEUE_LIMIT", str(workers * 64)))
+    return BoundedExecutor(name, workers, queue_limit)
+
+
+# File I/O and record validation
+storage_pool = _pool_from_env("storage", 4)
+# SentenceTransformer inference; torch already parallelizes each call internally
+embedding_pool = _pool_from_env("embedding", 1)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    return {pool.name: pool.stats() for pool in (storage_pool, embedding_pool)}
@@ -0,0 +1,62 @@
+import json
+from typing import Any, Dict, List
+
+
+class JSONObjectStreamParser:
+    """Incrementally pulls complete top-level JSON objects out of streamed text.
+
+    Meant for LLM output shaped like `[{...}, {...}]`: each object is returned
+    from `feed()` as soon as its closing brace arrives, without waiting for the
+    rest of the array. Text outside objects (prose, code fences, commas, the
+    array brackets) is ignored. A top-level wrapper such as
+    `{"milestones": [...]}` is unwrapped when it closes.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        completed = []
+        for char in chunk:
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._decode("".join(self._buffer)))
+                    self._buffer = []
+        return completed
+
+    @staticmethod
+    def _decode(text: str) -> List[Dict[str, Any]]:
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return []
+        if not isinstance(obj, dict):
+            return []
+        # A wrapper object: emit the objects of its first list of objects instead
+        if len(obj) == 1:
+            (value,) = obj.values()
+            if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+                return value
+        return [obj]
@@ -0,0 +1,133 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+SMART_FIELDS = ("specific", "measurable", "achievable", "relevant", "time_bound", "polished_title")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def document_text(record: Dict[str, Any]) -> str:
+    """The text of a dream that lexical search matches against."""
+    parts = [record.get("title") or "", record.get("notes") or ""]
+    smart = record.get("smart_data")
+    if smart is not None:
+        if not isinstance(smart, dict):
+            smart = smart.model_dump()
+        parts.extend(str(smart.get(field) or "") for field in SMART_FIELDS)
+    for entry in record.get("journal_entries") or []:
+        content = entry.get("content") if isinstance(entry, dict) else getattr(entry, "content", "")
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+class BM25Index:
+    """Okapi BM25 over dream text, kept as an in-memory inverted index.
+
+    Documents are added, replaced and removed one at a time, so the index can
+    follow every storage write. Category and target year are kept per
+    document so searches can filter without touching storage.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._meta: Dict[str, Tuple[str, int]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+
+    def upsert(self, doc_id: str, text: str, category: str = "", year: int = 0):
+        terms = Counter(tokenize(text))
+        self._meta[doc_id] = (category, year)
+        if self._terms.get(doc_id) == terms:
+            return
+        self.remove([doc_id], keep_meta=True)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self._terms[doc_id] = terms
+        length = sum(terms.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_ids: Iterable[str], keep_meta: bool = False):
+        for doc_id in doc_ids:
+            terms = self._terms.pop(doc_id, None)
+            if not keep_meta:
+                self._meta.pop(doc_id, None)
+            if terms is None:
+                continue
+            for term in terms:
+                posting = self.postings[term]
+                del posting[doc_id]
+                if not posting:
+                    del self.postings[term]
+            self._total_length -= self._lengths.pop(doc_id)
+
+    def _allowed(self, doc_id: str, category: Optional[str], year: Optional[int]) -> bool:
+        doc_category, doc_year = self._meta.get(doc_id, ("", 0))
+        return (category is None or doc_category == category) and (year is None or doc_year == year)
+
+    def _idf(self, term: str) -> float:
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self._lengths) - n + 0.5) / (n + 0.5))
+
+    def _term_score(self, idf: float, tf: int, length: int, avg_length: float) -> float:
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+
+    def search(self, query: str, k: int, category: Optional[str] = None, year: Optional[int] = None,
+               require_all: bool = False) -> List[Tuple[str, float]]:
+        """The k best (doc_id, score) pairs; with require_all, only documents containing every term."""
+        terms = set(tokenize(query))
+        if not terms or not self._lengths:
+            return []
+        if require_all and any(term not in self.postings for term in terms):
+            return []
+
+        avg_length = self._total_length / len(self._lengths) or 1.0
+        scores: Dict[str, float] = {}
+        matched: Counter = Counter()
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in posting.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + self._term_score(idf, tf, self._lengths[doc_id], avg_length)
+                matched[doc_id] += 1
+
+        results = [
+            (doc_id, score) for doc_id, score in scores.items()
+            if (not require_all or matched[doc_id] == len(terms)) and self._allowed(doc_id, category, year)
+        ]
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+    def score(self, query: str, doc_ids: Iterable[str]) -> Dict[str, float]:
+        """BM25 scores of specific documents, e.g. semantic candidates the lexical top-k missed."""
+        terms = set(tokenize(query))
+        if not self._lengths:
+            return {}
+        avg_length = self._total_length / len(self._lengths) or 1.0
+        idfs = {term: self._idf(term) for term in terms if term in self.postings}
+        scores = {}
+        for doc_id in doc_ids:
+            doc_terms = self._terms.get(doc_id)
+            if doc_terms is None:
+                continue
+            scores[doc_id] = sum(
+                self._term_score(idf, doc_terms[term], self._lengths[doc_id], avg_length)
+                for term, idf in idfs.items() if term in doc_terms
+            )
+        return scores
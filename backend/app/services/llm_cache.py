@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+def normalize_prompt_input(text: str) -> str:
+    # Resubmissions that differ only in case or spacing should hit the same entry
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class LLMCache:
+    """Two-tier cache for LLM results: an in-memory LRU with TTL, optionally
+    backed by one JSON file per entry on disk so results survive restarts.
+
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400, disk_dir: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, prompt_input: str, model: str, temperature: float) -> str:
+        payload = json.dumps([kind, normalize_prompt_input(prompt_input), model, temperature])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # Promote to memory for the remainder of its lifetime
+        self._remember(key, value[1], value[0])
+        return value[1]
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        self._write_disk(key, value, expires_at)
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("expires_at", 0) <= now:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return entry["expires_at"], entry["value"]
+
+    def _write_disk(self, key: str, value: Any, expires_at: float):
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write LLM cache entry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_enabled": self.disk_dir is not None,
+            }
+
+
+def cache_from_env() -> LLMCache:
+    disk_dir = os.getenv("LLM_CACHE_DIR")
+    return LLMCache(
+        max_entries=int(os.getenv("LLM_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+        disk_dir=Path(disk_dir) if disk_dir else None,
+    )
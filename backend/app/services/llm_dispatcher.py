@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Lower runs first. Interactive requests jump ahead of bulk work.
+DEFAULT_PRIORITIES = {
+    "polish": 0,
+    "analyze": 1,
+    "roadmap": 1,
+    "bulk_polish": 2,
+}
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued_at", "future")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.deduplicated = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.inference_total = 0.0
+        self.inference_max = 0.0
+        self.completed = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "queue_wait_avg_ms": self.queue_wait_total / self.completed * 1000 if self.completed else 0.0,
+            "queue_wait_max_ms": self.queue_wait_max * 1000,
+            "inference_avg_ms": self.inference_total / self.completed * 1000 if self.completed else 0.0,
+            "inference_max_ms": self.inference_max * 1000,
+        }
+
+
+class LLMDispatcher:
+    """Gatekeeper in front of the shared Ollama client.
+
+    - at most `max_concurrency` LLM calls run at once;
+    - waiting calls are served by endpoint priority, FIFO within a priority,
+      and a call waiting longer than `aging_seconds` is promoted so bulk work
+      cannot starve;
+    - identical in-flight calls (same key) share a single LLM call.
+
+    Queue wait and inference time are tracked separately per endpoint.
+    """
+
+    def __init__(self, max_concurrency: int = 2, aging_seconds: float = 30.0,
+                 priorities: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.aging_seconds = aging_seconds
+        self.priorities = priorities or dict(DEFAULT_PRIORITIES)
+        self._active = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._inflight_waiters: Dict[str, _Waiter] = {}
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def _endpoint_stats(self, endpoint: str) -> _EndpointStats:
+        if endpoint not in self._stats:
+            self._stats[endpoint] = _EndpointStats()
+        return self._stats[endpoint]
+
+    def _priority(self, endpoint: str) -> int:
+        return self.priorities.get(endpoint, 1)
+
+    async def _acquire(self, waiter: _Waiter):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+        self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # We were handed the slot just as we got cancelled: pass it on
+                self._release()
+            raise
+
+    def _release(self):
+        self._active -= 1
+        if not self._waiters:
+            return
+        now = time.monotonic()
+
+        def rank(w: _Waiter):
+            aged = now - w.enqueued_at >= self.aging_seconds
+            return (-1 if aged else w.priority, w.seq)
+
+        waiter = min(self._waiters, key=rank)
+        self._waiters.remove(waiter)
+        self._active += 1
+        waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str):
+        """Hold one LLM slot, e.g. for the whole duration of a streamed completion."""
+        stats = self._endpoint_stats(endpoint)
+        stats.requests += 1
+        waiter = _Waiter(self._priority(endpoint), next(self._seq), asyncio.get_running_loop().create_future())
+        await self._acquire(waiter)
+        started = time.monotonic()
+        waited = started - waiter.enqueued_at
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            stats.completed += 1
+            stats.queue_wait_total += waited
+            stats.queue_wait_max = max(stats.queue_wait_max, waited)
+            stats.inference_total += elapsed
+            stats.inference_max = max(stats.inference_max, elapsed)
+            self._release()
+
+    async def run(self, endpoint: str, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `call` under a slot, sharing the result with identical in-flight calls."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self._endpoint_stats(endpoint).deduplicated += 1
+            # An interactive request must not wait behind the bulk call it joined
+            waiter = self._inflight_waiters.get(key)
+            if waiter is not None and waiter in self._waiters:
+                waiter.priority = min(waiter.priority, self._priority(endpoint))
+            return await asyncio.shield(task)
+
+        stats = self._endpoint_stats(endpoint)
+        stats.requests += 1
+        waiter = _Waiter(self._priority(endpoint), next(self._seq), asyncio.get_running_loop().create_future())
+
+        async def leader():
+            await self._acquire(waiter)
+            started = time.monotonic()
+            waited = started - waiter.enqueued_at
+            try:
+                return await call()
+            finally:
+                elapsed = time.monotonic() - started
+                stats.completed += 1
+                stats.queue_wait_total += waited
+                stats.queue_wait_max = max(stats.queue_wait_max, waited)
+                stats.inference_total += elapsed
+                stats.inference_max = max(stats.inference_max, elapsed)
+                self._release()
+
+        # The call runs in its own task so a disconnecting client can't cancel it for the others
+        task = asyncio.ensure_future(leader())
+        self._inflight[key] = task
+        self._inflight_waiters[key] = waiter
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._inflight_waiters[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "inflight_keys": len(self._inflight),
+            "endpoints": {name: s.as_dict() for name, s in self._stats.items()},
+        }
+
+
+def dispatcher_from_env() -> LLMDispatcher:
+    priorities = dict(DEFAULT_PRIORITIES)
+    for endpoint in priorities:
+        value = os.getenv(f"LLM_PRIORITY_{endpoint.upper()}")
+        if value is not None:
+            priorities[endpoint] = int(value)
+    return LLMDispatcher(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "2")),
+        aging_seconds=float(os.getenv("LLM_QUEUE_AGING_SECONDS", "30")),
+        priorities=priorities,
+    )
@@ -0,0 +1,256 @@
+"""In-process metrics with Prometheus text exposition, and an opt-in profiler
+that dumps folded stacks of slow requests.
+
+Services record into the module-level `metrics` registry:
+
+    with metrics.timer("storage_stage_seconds", stage="load"):
+        ...
+    metrics.inc("search_queries_total", mode="hybrid")
+
+and GET /metrics renders everything recorded so far. Metrics are declared
+once below, so names, help text and buckets live in one place.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds, from sub-millisecond storage reads to multi-second LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# A collector returns (name, type, help, labels, value) samples computed at scrape time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+Collector = Callable[[], Iterable[Sample]]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = buckets
+        self._histograms[name] = {}
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block, in seconds, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """Everything recorded so far in the Prometheus text format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines.append(f"# HELP {name} {self._help[name][1]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, series in self._histograms.items():
+                lines.append(f"# HELP {name} {self._help[name][1]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (math.inf,), histogram.counts):
+                        cumulative += count
+                        le = _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        declared = set()
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+metrics.counter("http_requests_total", "HTTP requests by method, route and status")
+metrics.histogram("http_request_duration_seconds",
+                  "Time until the response starts (time to first byte for streams)")
+metrics.counter("http_unhandled_exceptions_total", "Exceptions that escaped a handler, by route and type")
+metrics.histogram("storage_stage_seconds", "Storage stages: load, catch_up, append (write + fsync), compact, serialize")
+metrics.histogram("storage_commit_batch_size", "Mutations persisted by one group commit", SIZE_BUCKETS)
+metrics.counter("storage_log_ops_total", "Operations appended to the dream logs, by op")
+metrics.counter("storage_shards_evicted_total", "Idle owner shards unloaded to stay under STORAGE_MAX_SHARDS")
+metrics.histogram("search_stage_seconds", "Search stages: encode_query, encode_corpus, vector, lexical, hybrid")
+metrics.counter("search_queries_total", "Search queries by mode")
+metrics.counter("search_encoded_texts_total", "Texts encoded by the embedding model, by purpose")
+metrics.counter("search_partitions_evicted_total", "Idle owner search partitions unloaded to stay under SEARCH_MAX_PARTITIONS")
+metrics.histogram("llm_request_seconds", "LLM calls from request to last token, by kind")
+metrics.histogram("llm_time_to_first_token_seconds", "Streaming LLM calls until the first chunk, by kind")
+metrics.counter("llm_tokens_total", "Tokens generated by the LLM, by kind")
+metrics.histogram("llm_tokens_per_second", "Generation speed of LLM calls, by kind", RATE_BUCKETS)
+metrics.counter("llm_errors_total", "Failed LLM calls, by kind")
+
+
+class SlowRequestProfiler:
+    """Sampling profiler that keeps the stacks of requests slower than a threshold.
+
+    While at least one request is in flight, a background thread samples the
+    stack of every thread (event loop and worker pools) every `interval`
+    seconds and adds it to each in-flight request. When a request finishes
+    above the threshold its samples are written in the folded format that
+    flamegraph.pl and speedscope read (`frame;frame;frame count` per line).
+    Samples are attributed by time, so concurrent requests share stacks.
+    """
+
+    def __init__(self, threshold: float, interval: float, directory: Path, max_files: int = 200):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._active: Dict[int, Counter] = {}
+        self._next_token = 0
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dumps = 0
+
+    def begin(self) -> int:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+            self._next_token += 1
+            self._active[self._next_token] = Counter()
+            self._wake.set()
+            return self._next_token
+
+    def end(self, token: int, duration: float, label: str) -> Optional[Path]:
+        with self._lock:
+            samples = self._active.pop(token, None)
+            if not self._active:
+                self._wake.clear()
+        if samples is None or duration < self.threshold or not samples:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = sorted(self.directory.glob("*.folded"))
+        for old in existing[:max(len(existing) - self.max_files + 1, 0)]:
+            old.unlink(missing_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")[:80]
+        path = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{int(duration * 1000)}ms-{safe_label}.folded"
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumps += 1
+        return path
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(frames)))
+            with self._lock:
+                for samples in self._active.values():
+                    samples.update(stacks)
+
+
+def profiler_from_env() -> Optional[SlowRequestProfiler]:
+    """Enabled by PROFILE_SLOW_REQUESTS_MS; off by default because sampling costs CPU."""
+    threshold = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+    if not threshold:
+        return None
+    return SlowRequestProfiler(
+        threshold=float(threshold) / 1000,
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+        directory=Path(os.getenv("PROFILE_DIR", "data/profiles")),
+    )
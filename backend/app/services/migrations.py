@@ -0,0 +1,107 @@
+"""Versioned schema migrations for stored dream records.
+
+Every record carries a `schema_version`; records written before versioning
+have none and count as version 1. `MIGRATIONS[n]` turns a version-n record
+into a version n+1 record, and `upgrade()` chains them up to
+SCHEMA_VERSION. Storage upgrades records lazily as it loads them, so old
+snapshots keep working without downtime; the next compaction (or
+`python migrate.py`) writes the upgraded records back.
+
+To change the schema, bump SCHEMA_VERSION and register a migration for the
+previous version. Migrations must be pure functions of the record that
+return a new dict and keep every field they don't know about.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from ..models import DreamCategory
+
+SCHEMA_VERSION = 2
+
+Record = Dict[str, Any]
+MIGRATIONS: Dict[int, Callable[[Record], Record]] = {}
+
+# Free-form categories from before the fixed DreamCategory list
+CATEGORY_MAP = {
+    "Career": "Career & Business",
+    "Business": "Career & Business",
+    "Finance": "Finance & Wealth",
+    "Health": "Health & Wellness",
+    "Fitness": "Health & Wellness",
+    "Social": "Relationships & Family",  # Mapping social to family/relationships
+    "Family": "Relationships & Family",
+    "Travel": "Travel & Adventure",
+    "Personal Growth": "Skills & Knowledge",
+    "Skill Development": "Skills & Knowledge",
+    "Gardening": "Lifestyle & Hobbies",
+    "Cuisine": "Lifestyle & Hobbies",
+    "Outdoor Activities": "Lifestyle & Hobbies",
+    "Volunteer": "Other",
+    "Other": "Other",
+}
+CATEGORIES = {category.value for category in DreamCategory}
+
+
+def migration(from_version: int):
+    def register(fn: Callable[[Record], Record]) -> Callable[[Record], Record]:
+        MIGRATIONS[from_version] = fn
+        return fn
+    return register
+
+
+@migration(1)
+def _categories_v2(record: Record) -> Record:
+    category = record.get("category") or "Other"
+    if category not in CATEGORIES:
+        category = CATEGORY_MAP.get(category, "Other")
+    return {**record, "category": category}
+
+
+def version_of(record: Record) -> int:
+    return record.get("schema_version") or 1
+
+
+def is_current(record: Record) -> bool:
+    return version_of(record) == SCHEMA_VERSION
+
+
+def upgrade(record: Record) -> Record:
+    """The record at SCHEMA_VERSION; the same object if it already is."""
+    version = version_of(record)
+    if version == SCHEMA_VERSION:
+        return record
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Dream {record.get('id')} has schema version {version}, newer than {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        record = MIGRATIONS[version](record)
+        version += 1
+    return {**record, "schema_version": SCHEMA_VERSION}
+
+
+def stamp(record: Record) -> Record:
+    """Mark a record built from the current models as current, without migrating it."""
+    return record if record.get("schema_version") == SCHEMA_VERSION else {**record, "schema_version": SCHEMA_VERSION}
+
+
+def _upgrade_chunk(records: List[Record]) -> List[Record]:
+    return [upgrade(record) for record in records]
+
+
+def upgrade_records(records: List[Record], workers: int = 1, chunk_size: int = 10000) -> List[Record]:
+    """Upgrade many records, in chunks over `workers` processes when there are enough outdated ones."""
+    outdated = [i for i, record in enumerate(records) if not is_current(record)]
+    if not outdated:
+        return records
+    upgraded = list(records)
+    if workers <= 1 or len(outdated) <= chunk_size:
+        for i in outdated:
+            upgraded[i] = upgrade(records[i])
+        return upgraded
+
+    chunks = [outdated[start:start + chunk_size] for start in range(0, len(outdated), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_upgrade_chunk, ([records[i] for i in chunk] for chunk in chunks))
+        for chunk, chunk_result in zip(chunks, results):
+            for i, record in zip(chunk, chunk_result):
+                upgraded[i] = record
+    return upgraded
@@ -0,0 +1,126 @@
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+from ..models import DreamCategory, DreamCollection
+
+CATEGORY_VALUES = [c.value for c in DreamCategory]
+
+
+def strip_code_fences(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```"):
+        content = re.sub(r'^```(?:json)?\s*', '', content)
+        content = re.sub(r'\s*```$', '', content)
+    return content
+
+
+def extract_json(content: str) -> Any:
+    """Parse the outermost JSON object or array embedded in surrounding prose."""
+    content = strip_code_fences(content)
+    match = re.search(r'[\{\[][\s\S]*[\}\]]', content)
+    if not match:
+        raise ValueError("No JSON found in LLM output")
+    return json.loads(match.group())
+
+
+def reshape_dreams(data: Any) -> Dict[str, Any]:
+    """Coerce the shapes the LLM tends to return into {"dreams": [...]}."""
+    # Handle case where LLM returns dreams grouped by category
+    if isinstance(data, dict) and "dreams" not in data:
+        dreams_list = []
+        for category, items in data.items():
+            if isinstance(items, list):
+                for item in items:
+                    if isinstance(item, dict):
+                        # Normalize the item
+                        dream = {
+                            "title": item.get("title", item.get("Title", "")),
+                            "category": category if category in CATEGORY_VALUES else "Other",
+                            "suggested_target_year": item.get("suggested_target_year",
+                                                              item.get("target_year",
+                                                                       item.get("Target Year",
+                                                                                item.get("year", 2026))))
+                        }
+                        if dream["title"]:
+                            dreams_list.append(dream)
+        data = {"dreams": dreams_list}
+
+    # Handle case where data is already a list
+    if isinstance(data, list):
+        data = {"dreams": data}
+
+    if not isinstance(data, dict) or "dreams" not in data:
+        raise ValueError("AI response missing 'dreams' field")
+
+    # Ensure all dreams have required fields
+    valid_dreams = []
+    for dream in data["dreams"]:
+        if not isinstance(dream, dict):
+            continue
+        # Normalize field names
+        if "Title" in dream:
+            dream["title"] = dream.pop("Title")
+        if "target_year" in dream or "Target Year" in dream:
+            dream["suggested_target_year"] = dream.pop("target_year", dream.pop("Target Year", 2026))
+        if "Category" in dream:
+            dream["category"] = dream.pop("Category")
+        if "suggested_target_year" not in dream:
+            dream["suggested_target_year"] = 2026
+        if "category" not in dream:
+            dream["category"] = "Other"
+        # Ensure title exists
+        if "title" in dream and dream["title"]:
+            valid_dreams.append(dream)
+
+    if not valid_dreams:
+        raise ValueError("No valid dreams found in the AI response")
+    return {"dreams": valid_dreams}
+
+
+# Ordered from least to most invasive: (stage name, parse, reshape afterwards)
+REPAIR_STAGES: List[Tuple[str, Callable[[str], Any], bool]] = [
+    ("direct", lambda content: json.loads(content), False),
+    ("strip_fences", lambda content: json.loads(strip_code_fences(content)), False),
+    ("extract_json", extract_json, False),
+    ("reshape", extract_json, True),
+]
+
+
+class DreamOutputRepair:
+    """Turns one raw LLM completion into a DreamCollection by trying each
+    repair stage in order, and counts which stage succeeded."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_counts: Dict[str, int] = {name: 0 for name, _, _ in REPAIR_STAGES}
+        self.stage_counts["failed"] = 0
+
+    def repair(self, content: str) -> DreamCollection:
+        for name, parse, reshape in REPAIR_STAGES:
+            try:
+                data = parse(content)
+                if reshape:
+                    data = reshape_dreams(data)
+                result = DreamCollection(**data)
+            except Exception:
+                continue
+            self._count(name)
+            return result
+
+        self._count("failed")
+        raise ValueError("Unable to parse dream analysis. Please try rephrasing your input.")
+
+    def _count(self, stage: str):
+        with self._lock:
+            self.stage_counts[stage] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.stage_counts.values())
+            fallback = total - self.stage_counts["direct"]
+            return {
+                "stages": dict(self.stage_counts),
+                "total": total,
+                "fallback_rate": fallback / total if total else 0.0,
+            }
@@ -1,43 +1,526 @@
 import numpy as np
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
-from .storage_service import storage_service
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from .storage_service import storage_service, Change, DEFAULT_OWNER, owner_path, validate_owner
+from .embedding_store import EmbeddingStore, EMBEDDINGS_FILE, content_hash
+from .lexical_index import BM25Index, document_text
+from .vector_index import ExactIndex, create_index, evaluate_recall
+from .embedding_server import EmbeddingClient, SharedEmbeddingView
+from .executors import embedding_pool
+from .metrics import metrics
+
+
+def _field(record: Dict[str, Any], key: str) -> str:
+    value = record.get(key) or ""
+    # Records coming straight from model_dump() still hold DreamCategory members
+    return str(getattr(value, "value", value))
+
+
+def _year(record: Dict[str, Any]) -> int:
+    try:
+        return int(record.get("suggested_target_year") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+SEARCH_MODES = ("hybrid", "semantic", "lexical")
+# Owners' search state kept in memory; the least recently used idle partitions are unloaded beyond this
+MAX_PARTITIONS = int(os.getenv("SEARCH_MAX_PARTITIONS", "64"))
+
+
+class _Partition:
+    """One owner's search state: embeddings, vector index and BM25 index."""
+
+    def __init__(self, store: EmbeddingStore, index: ExactIndex, shared: bool = False):
+        self.store = store
+        self.index = index
+        # Shared partitions are kept up to date by the embedding service, not by us
+        self.shared = shared
+        self.ready = False
+        # Set while _ensure_ready() reads storage: changes arriving meanwhile are queued, not dropped
+        self.loading = False
+        # Unloaded to make room for other owners: storage changes no longer reach it
+        self.evicted = False
+        self.last_used = time.monotonic()
+        self.lexical = BM25Index()
+        self.lexical_ready = False
+        # Guards the BM25 index, so keeping it current never waits on vector work
+        self.lexical_lock = threading.RLock()
+        # Storage changes not embedded yet, by dream id (None: removed)
+        self.pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.pending_lock = threading.Lock()
+        self.drain_queued = False
+        # Held while embedding pending changes, so they are applied in order
+        self.drain_lock = threading.Lock()
+
 
 class SearchService:
-    def __init__(self):
+    """Semantic, lexical and hybrid search, partitioned by owner.
+
+    Each owner gets its own embedding store, vector index and BM25 index,
+    loaded on the owner's first search, so ranking cost depends only on that
+    owner's dreams. Methods take an optional `owner`; None is the default owner.
+    """
+
+    def __init__(self, remote_address: Optional[str] = None):
         # Using a small, fast model for local execution
         self.model_name = "all-MiniLM-L6-v2"
-        print(f"Loading search model: {self.model_name}")
-        self.model = SentenceTransformer(self.model_name)
-    
-    def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-    def search_dreams(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        dreams = storage_service.get_all_dreams()
-        if not dreams:
+        # Nothing heavy happens at import: the model and the embeddings are
+        # loaded on first use, or ahead of time by warm_up()
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.model_state = "not_loaded"
+        self.model_error: Optional[str] = None
+        self.model_load_seconds: Optional[float] = None
+
+        # Storage listeners run on the writer thread while searches run on the
+        # embedding pool, so embeddings are only touched under this lock (and
+        # each partition's BM25 index under its lexical_lock)
+        self._lock = threading.RLock()
+        self._partitions: Dict[str, _Partition] = {}
+        self.remote: Optional[EmbeddingClient] = None
+        if remote_address:
+            # Multi-worker mode: the embedding service owns the model and keeps the
+            # default owner's embeddings in sync with storage; we only map its matrix
+            self.remote = EmbeddingClient(remote_address)
+            self.model_state = "remote"
+        # Weight of the cosine score in hybrid ranking; the rest goes to normalized BM25
+        self.hybrid_alpha = float(os.getenv("SEARCH_HYBRID_ALPHA", "0.5"))
+        storage_service.subscribe(self._on_storage_change)
+
+    @property
+    def model(self):
+        if self.remote is not None:
+            return self.remote
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self.model_state = "loading"
+                    print(f"Loading search model: {self.model_name}")
+                    started = time.perf_counter()
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self.model_state = "error"
+                        self.model_error = str(e)
+                        raise
+                    self.model_load_seconds = time.perf_counter() - started
+                    self.model_state = "ready"
+        return self._model
+
+    def _partition(self, owner: Optional[str] = None) -> _Partition:
+        owner = validate_owner(owner)
+        partition = self._partitions.get(owner)
+        if partition is None:
+            with self._lock:
+                partition = self._partitions.get(owner)
+                if partition is None:
+                    self._evict_partitions()
+                    partition = self._new_partition(owner)
+                    self._partitions[owner] = partition
+        partition.last_used = time.monotonic()
+        return partition
+
+    def _evict_partitions(self):
+        """Unload the least recently used idle partitions to make room for one more. Call with `_lock` held.
+
+        Partitions with storage changes still to embed, or still loading,
+        are kept. Embeddings are saved first, so reloading one is cheap.
+        """
+        excess = len(self._partitions) + 1 - MAX_PARTITIONS
+        if excess <= 0:
+            return
+        idle = [(owner, partition) for owner, partition in self._partitions.items()
+                if owner != DEFAULT_OWNER and not partition.shared]
+        for owner, partition in sorted(idle, key=lambda item: item[1].last_used):
+            if excess <= 0:
+                break
+            with partition.pending_lock:
+                if partition.pending or partition.drain_queued or partition.loading:
+                    continue
+                partition.evicted = True
+            if partition.ready:
+                partition.store.flush()
+                partition.index.save()
+            del self._partitions[owner]
+            metrics.inc("search_partitions_evicted_total")
+            excess -= 1
+
+    def _new_partition(self, owner: str) -> _Partition:
+        if self.remote is not None and owner == DEFAULT_OWNER:
+            store = SharedEmbeddingView(self.remote, model_name=self.model_name)
+            return _Partition(store, ExactIndex(store), shared=True)
+        store = EmbeddingStore(path=owner_path(owner, EMBEDDINGS_FILE.name), model_name=self.model_name)
+        return _Partition(store, create_index(store, directory=store.path.parent))
+
+    # The default owner's state, for single-tenant callers and the embedding service
+    @property
+    def store(self) -> EmbeddingStore:
+        return self._partition().store
+
+    @property
+    def index(self) -> ExactIndex:
+        return self._partition().index
+
+    @property
+    def lexical(self) -> BM25Index:
+        return self._partition().lexical
+
+    def _ensure_ready(self, owner: Optional[str] = None) -> _Partition:
+        """Load an owner's persisted embeddings and reconcile them with storage, once."""
+        partition = self._partition(owner)
+        if partition.ready:
+            return partition
+        with self._lock:
+            if partition.ready:
+                return partition
+            partition.store.load()
+            if not partition.shared:
+                partition.index.load()
+                with partition.pending_lock:
+                    partition.loading = True
+                try:
+                    self._sync(partition, storage_service.load_dreams_raw(owner))
+                except Exception:
+                    with partition.pending_lock:
+                        # The next attempt reads storage again
+                        partition.loading = False
+                        partition.pending = {}
+                    raise
+            with partition.pending_lock:
+                partition.ready = True
+                partition.loading = False
+                drain = bool(partition.pending) and not partition.drain_queued
+                partition.drain_queued = partition.drain_queued or drain
+        if drain:
+            embedding_pool.submit(self._drain_job, partition)
+        return partition
+
+    def _ensure_lexical(self, owner: Optional[str] = None) -> _Partition:
+        partition = self._partition(owner)
+        if partition.lexical_ready:
+            return partition
+        with partition.lexical_lock:
+            if partition.lexical_ready:
+                return partition
+            for record in storage_service.load_dreams_raw(owner):
+                if record.get("id"):
+                    self._index_text(partition, record)
+            partition.lexical_ready = True
+        return partition
+
+    def _index_text(self, partition: _Partition, record: Dict[str, Any]):
+        partition.lexical.upsert(record["id"], document_text(record), _field(record, "category"), _year(record))
+
+    def refresh(self, owner: Optional[str] = None):
+        """Pick up writes made by other processes."""
+        partition = self._ensure_ready(owner)
+        if partition.shared:
+            with self._lock:
+                partition.store.refresh()
+        else:
+            # Tailing the storage log feeds new writes through _on_storage_change
+            storage_service.refresh(owner)
+
+    def warm_up(self):
+        """Load the model and the default owner's embeddings ahead of the first search."""
+        self.model.encode("warm up")
+        self._ensure_ready()
+
+    @property
+    def ready(self) -> bool:
+        partition = self._partitions.get(DEFAULT_OWNER)
+        return partition is not None and partition.ready and self.model_state in ("ready", "remote")
+
+    def status(self) -> Dict[str, Any]:
+        partition = self._partition()
+        return {
+            "model": self.model_name,
+            "state": self.model_state,
+            "error": self.model_error,
+            "load_seconds": self.model_load_seconds,
+            "embeddings_loaded": partition.ready,
+            "embeddings": len(partition.store) if partition.ready else None,
+            "shared_generation": partition.store.generation if partition.shared else None,
+            "lexical_documents": len(partition.lexical) if partition.lexical_ready else None,
+            "partitions": len(self._partitions),
+        }
+
+    def _encode_records(self, partition: _Partition, records: List[Dict[str, Any]]):
+        """Encode only the records whose title/category changed since they were last embedded."""
+        stale = self._stale(partition, records)
+        if stale:
+            self._store_vectors(partition, stale, self._encode_stale(stale))
+
+    def _stale(self, partition: _Partition, records: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], str]]:
+        """(record, content hash) of the records that need a new vector; the others only get their metadata updated."""
+        store = partition.store
+        stale = []
+        for record in records:
+            category = _field(record, "category")
+            digest = content_hash(_field(record, "title"), category)
+            if store.hash_of(record["id"]) == digest:
+                # Same vector, but the target year may still have changed
+                store.set_metadata([record["id"]], [category], [_year(record)])
+                continue
+            stale.append((record, digest))
+        return stale
+
+    def _encode_stale(self, stale: List[Tuple[Dict[str, Any], str]]) -> np.ndarray:
+        texts = [f"{_field(record, 'title')} {_field(record, 'category')}" for record, _ in stale]
+        with metrics.timer("search_stage_seconds", stage="encode_corpus"):
+            vectors = self.model.encode(texts)
+        metrics.inc("search_encoded_texts_total", len(texts), purpose="corpus")
+        return vectors
+
+    def _store_vectors(self, partition: _Partition, stale: List[Tuple[Dict[str, Any], str]], vectors: np.ndarray):
+        ids = [record["id"] for record, _ in stale]
+        partition.store.upsert(ids, [digest for _, digest in stale], vectors,
+                               [_field(record, "category") for record, _ in stale],
+                               [_year(record) for record, _ in stale])
+        partition.index.add(ids)
+
+    def sync(self, records: List[Dict[str, Any]], owner: Optional[str] = None):
+        """Reconcile an owner's persisted embeddings with the current contents of storage."""
+        with self._lock:
+            self._sync(self._partition(owner), records)
+
+    def _sync(self, partition: _Partition, records: List[Dict[str, Any]]):
+        records = [r for r in records if r.get("id")]
+        live_ids = {r["id"] for r in records}
+        self._remove(partition, [i for i in list(partition.store.ids) if i not in live_ids])
+        self._encode_records(partition, records)
+        partition.store.flush()
+        partition.index.save()
+
+    def _remove(self, partition: _Partition, ids: List[str]):
+        partition.index.remove(ids)
+        partition.store.remove(ids)
+
+    def _on_storage_change(self, owner: str, changes: List[Change]):
+        """Storage listener, called on the storage writer thread: only queues the embedding work."""
+        partition = self._partitions.get(owner)
+        if partition is None:
+            # Nothing loaded for this owner yet; the first search reads storage
+            return
+        removed = [old["id"] for old, new in changes if new is None and old.get("id")]
+        written = [new for old, new in changes if new is not None and new.get("id")]
+        with partition.lexical_lock:
+            if partition.lexical_ready:
+                partition.lexical.remove(removed)
+                for record in written:
+                    self._index_text(partition, record)
+        if partition.shared:
+            # Shared embeddings are kept up to date by the embedding service
+            return
+        with partition.pending_lock:
+            if partition.evicted or not (partition.ready or partition.loading):
+                # _ensure_ready() will pick these up from storage
+                return
+            partition.pending.update((dream_id, None) for dream_id in removed)
+            partition.pending.update((record["id"], record) for record in written)
+            if partition.drain_queued or not partition.ready:
+                # While loading, _ensure_ready() queues the drain once it is done
+                return
+            partition.drain_queued = True
+        embedding_pool.submit(self._drain_job, partition)
+
+    def _drain_job(self, partition: _Partition):
+        try:
+            self._drain(partition)
+            # Persisting rewrites the whole matrix, so it is throttled and never on a write path
+            with self._lock:
+                if partition.store.maybe_save():
+                    partition.index.save()
+        except Exception as e:
+            print(f"Embedding storage changes failed: {e}")
+
+    def _drain(self, partition: _Partition):
+        """Embed the storage changes queued for a partition.
+
+        Searches call this too before ranking, so they see every write that
+        completed before them, and encode on the embedding pool either way.
+        """
+        with partition.drain_lock:
+            with partition.pending_lock:
+                pending, partition.pending = partition.pending, {}
+                partition.drain_queued = False
+            if not pending:
+                return
+            with self._lock:
+                self._remove(partition, [dream_id for dream_id, record in pending.items() if record is None])
+                stale = self._stale(partition, [record for record in pending.values() if record is not None])
+            if stale:
+                # Encoded without the search lock, so searches keep running meanwhile
+                vectors = self._encode_stale(stale)
+                with self._lock:
+                    self._store_vectors(partition, stale, vectors)
+
+    def flush(self):
+        for partition in list(self._partitions.values()):
+            if partition.ready and not partition.shared:
+                self._drain(partition)
+                with self._lock:
+                    partition.store.flush()
+                    partition.index.save()
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        with metrics.timer("search_stage_seconds", stage="encode_query"):
+            query_embedding = np.asarray(self.model.encode(query), dtype=np.float32)
+        metrics.inc("search_encoded_texts_total", purpose="query")
+        norm = np.linalg.norm(query_embedding)
+        return query_embedding / norm if norm else query_embedding
+
+    @staticmethod
+    def _quoted(query: str) -> Optional[str]:
+        query = query.strip()
+        if len(query) > 1 and query.startswith('"') and query.endswith('"'):
+            return query[1:-1]
+        return None
+
+    def is_lexical(self, query: str, mode: str = "hybrid") -> bool:
+        """Whether the query is answered from the inverted index alone, without the encoder."""
+        return mode == "lexical" or self._quoted(query) is not None
+
+    def search_dreams(self, query: str, limit: int = 5, category: Optional[str] = None,
+                      year: Optional[int] = None, mode: str = "hybrid",
+                      owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rank one owner's dreams by BM25, cosine similarity, or a weighted mix of both.
+
+        A query wrapped in double quotes only matches dreams containing every
+        quoted word, and never touches the embedding model.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; expected one of {SEARCH_MODES}")
+        quoted = self._quoted(query)
+        metrics.inc("search_queries_total", mode="quoted" if quoted is not None else mode)
+        if quoted is not None:
+            ranked = self._lexical_ranking(owner, quoted, limit, category, year, require_all=True)
+            return self._results(ranked, owner)
+        if mode == "lexical":
+            return self._results(self._lexical_ranking(owner, query, limit, category, year), owner)
+
+        partition = self._ensure_ready(owner)
+        if partition.shared:
+            self.refresh(owner)
+        self._drain(partition)
+        if len(partition.store) == 0 and mode == "semantic":
             return []
 
-        # Generate query embedding
-        query_embedding = self.model.encode(query)
+        # Only the query is encoded; rows are pre-normalized so scores are cosines
+        query_embedding = self._encode_query(query)
+        if mode == "semantic":
+            return self._results(self._semantic_ranking(partition, query_embedding, limit, category, year), owner)
+        with metrics.timer("search_stage_seconds", stage="hybrid"):
+            ranked = self._hybrid_ranking(owner, partition, query, query_embedding, limit, category, year)
+        return self._results(ranked, owner)
+
+    def _lexical_ranking(self, owner: Optional[str], query: str, limit: int, category: Optional[str],
+                         year: Optional[int], require_all: bool = False) -> List[Tuple[str, float]]:
+        partition = self._ensure_lexical(owner)
+        # Writes from other processes reach the index through the storage listener
+        storage_service.refresh(owner)
+        with partition.lexical_lock, metrics.timer("search_stage_seconds", stage="lexical"):
+            return partition.lexical.search(query, limit, category=category, year=year, require_all=require_all)
+
+    def _semantic_ranking(self, partition: _Partition, query_embedding: np.ndarray, limit: int,
+                          category: Optional[str], year: Optional[int]) -> List[Tuple[str, float]]:
+        with self._lock:
+            store = partition.store
+            if len(store) == 0:
+                return []
+            with metrics.timer("search_stage_seconds", stage="vector"):
+                mask = store.mask(category=category, year=year)
+                rows, scores = partition.index.search(query_embedding, limit, mask)
+            return [(store.ids[row], float(score)) for row, score in zip(rows, scores)]
+
+    def _hybrid_ranking(self, owner: Optional[str], partition: _Partition, query: str,
+                        query_embedding: np.ndarray, limit: int, category: Optional[str],
+                        year: Optional[int]) -> List[Tuple[str, float]]:
+        """Fuse cosine and BM25 scores over the union of both candidate lists.
+
+        BM25 is divided by the best BM25 score of the query so both signals
+        are on a comparable 0..1 scale before weighting.
+        """
+        candidates = max(limit * 4, 20)
+        cosines = dict(self._semantic_ranking(partition, query_embedding, candidates, category, year))
+        lexical = dict(self._lexical_ranking(owner, query, candidates, category, year))
+        with partition.lexical_lock:
+            lexical.update(partition.lexical.score(query, [i for i in cosines if i not in lexical]))
+        with self._lock:
+            store = partition.store
+            missing = [i for i in lexical if i not in cosines and i in store]
+            if missing:
+                rows = np.array([store.row(i) for i in missing], dtype=np.int64)
+                cosines.update(zip(missing, store.score(query_embedding, rows).tolist()))
+
+        best_lexical = max(lexical.values(), default=0.0) or 1.0
+        alpha = self.hybrid_alpha
+        fused = [
+            (dream_id, alpha * cosines.get(dream_id, 0.0) + (1 - alpha) * lexical.get(dream_id, 0.0) / best_lexical)
+            for dream_id in set(cosines) | set(lexical)
+        ]
+        fused.sort(key=lambda item: item[1], reverse=True)
+        return fused[:limit]
+
+    def _results(self, ranked: List[Tuple[str, float]], owner: Optional[str]) -> List[Dict[str, Any]]:
+        dreams = storage_service.get_dreams_by_ids([dream_id for dream_id, _ in ranked], owner=owner)
+        return [
+            {"dream": dreams[dream_id], "score": float(score)}
+            for dream_id, score in ranked
+            if dream_id in dreams
+        ]
+
+    def find_duplicates(self, texts: List[str], threshold: float,
+                        owner: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """The closest near-duplicate of each incoming dream text, if any reaches `threshold`.
+
+        Texts are `"{title} {category}"`, as dreams are embedded. All of them
+        are encoded in one model call; each is matched against the owner's
+        stored dreams through the vector index (so IVF/HNSW keep it
+        sub-linear) and against the texts before it in the same batch.
+        Returns {"dream_id", "score"} for a stored match, {"batch_index",
+        "score"} for an earlier text of the batch, or None.
+        """
+        if not texts:
+            return []
+        partition = self._ensure_ready(owner)
+        if partition.shared:
+            self.refresh(owner)
+        self._drain(partition)
+        with metrics.timer("search_stage_seconds", stage="encode_dedup"):
+            vectors = np.asarray(self.model.encode(texts), dtype=np.float32).reshape(len(texts), -1)
+        metrics.inc("search_encoded_texts_total", len(texts), purpose="dedup")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
 
-        # Optimization: Batch encode all dreams at once
-        dream_texts = [f"{d.title} {d.category}" for d in dreams]
-        dream_embeddings = self.model.encode(dream_texts)
+        matches: List[Optional[Dict[str, Any]]] = []
+        with self._lock, metrics.timer("search_stage_seconds", stage="dedup"):
+            store = partition.store
+            for vector in vectors:
+                match = None
+                if len(store):
+                    rows, scores = partition.index.search(vector, 1)
+                    if len(rows) and scores[0] >= threshold:
+                        match = {"dream_id": store.ids[rows[0]], "score": float(scores[0])}
+                matches.append(match)
 
-        results = []
-        for i, dream in enumerate(dreams):
-            similarity = float(self._cosine_similarity(query_embedding, dream_embeddings[i]))
-            results.append({
-                "dream": dream,
-                "score": similarity
-            })
+        # Within the batch: pairwise, but batches are small
+        similarities = vectors @ vectors.T
+        for i in range(1, len(texts)):
+            j = int(np.argmax(similarities[i, :i]))
+            score = float(similarities[i, j])
+            if score >= threshold and (matches[i] is None or score > matches[i]["score"]):
+                matches[i] = {"batch_index": j, "score": score}
+        return matches
 
-        # Sort by similarity score descending
-        results.sort(key=lambda x: x["score"], reverse=True)
-        
-        return results[:limit]
+    def evaluate_recall(self, queries: List[str], k: int = 10, owner: Optional[str] = None) -> Dict[str, float]:
+        """Recall@k of the configured index against exact cosine ranking."""
+        partition = self._ensure_ready(owner)
+        return evaluate_recall(partition.index, np.array([self._encode_query(q) for q in queries]), k)
 
-search_service = SearchService()
+search_service = SearchService(remote_address=os.getenv("EMBEDDING_SERVICE_ADDRESS"))
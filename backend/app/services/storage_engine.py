@@ -0,0 +1,269 @@
+import json
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+# Records serialized per json.dumps call when writing a snapshot: the C encoder holds
+# the GIL for a whole call, so one call for everything would stall every other thread
+SNAPSHOT_CHUNK = 1000
+
+
+class DreamLog:
+    """Snapshot plus append-only operation log for dream records.
+
+    The snapshot is the plain JSON array `dreams.json` always was; every write
+    since the last compaction is appended to the log as one JSON line:
+
+        {"op": "put", "record": {...}}
+        {"op": "patch", "id": "...", "fields": {...}}
+        {"op": "delete", "id": "..."}
+        {"op": "item_put", "id": "...", "list": "milestones", "item": {...}}
+        {"op": "item_delete", "id": "...", "list": "milestones", "item_id": "..."}
+
+    The item ops change a single journal entry or milestone of a dream, so a
+    write costs the same however long the dream's history is.
+
+    Loading replays the log over the snapshot; compaction folds it back in.
+    Every op is idempotent, so replaying an op twice (e.g. a reader racing a
+    compaction in another process) is harmless.
+
+    Compaction can also run without blocking writers: `write_snapshot()`
+    serializes the records as of some log position without the lock, and
+    `swap_snapshot()` then installs it under the lock, carrying the ops
+    appended since that position over into the new log.
+
+    Several processes may share the files: writers serialize on an exclusive
+    `flock` of the lock file, and each process tails the log to pick up
+    operations appended by the others.
+    """
+
+    def __init__(self, snapshot_path: Path, log_path: Path, lock_path: Optional[Path] = None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.lock_path = lock_path or log_path.with_suffix(".lock")
+        # Byte offset of the end of the last complete log line we have applied
+        self._offset = 0
+        self._snapshot_id: Optional[Tuple[int, int]] = None
+        self.snapshot_bytes = 0
+
+    @property
+    def position(self) -> Tuple[Optional[Tuple[int, int]], int]:
+        """(snapshot identity, log offset): the same in every process that has caught up to it."""
+        return self._snapshot_id, self._offset
+
+    @property
+    def log_bytes(self) -> int:
+        """Size of the log we have applied, i.e. the work a compaction would save."""
+        return self._offset
+
+    @contextmanager
+    def locked(self):
+        """Exclusive cross-process lock held while appending or compacting."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _stat_snapshot(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _snapshot_size(self) -> int:
+        try:
+            return os.path.getsize(self.snapshot_path)
+        except FileNotFoundError:
+            return 0
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        records: Dict[str, Dict[str, Any]] = {}
+        self._snapshot_id = self._stat_snapshot()
+        self.snapshot_bytes = self._snapshot_size()
+        if self._snapshot_id is not None:
+            with open(self.snapshot_path, "r") as f:
+                try:
+                    raw = json.load(f)
+                except json.JSONDecodeError as e:
+                    # Refuse to continue: treating it as empty would wipe it at the next compaction
+                    raise ValueError(f"{self.snapshot_path} is corrupted: {e}")
+            for record in raw:
+                if not record.get("id"):
+                    record["id"] = str(uuid.uuid4())
+                records[record["id"]] = record
+
+        self._offset = 0
+        for op in self.read_new_ops() or []:
+            apply_op(records, op)
+        return records
+
+    def read_new_ops(self) -> Optional[List[Dict[str, Any]]]:
+        """Complete ops appended since the last read, or None when another
+        process compacted the files and a full `load()` is required."""
+        size = self._log_size()
+        if self._stat_snapshot() != self._snapshot_id or size < self._offset:
+            return None
+        if size == self._offset:
+            return []
+
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        # A trailing partial line is a write still in progress (or torn by a crash)
+        complete = data[:data.rfind(b"\n") + 1]
+        ops = []
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable entry in {self.log_path}")
+        self._offset += len(complete)
+        return ops
+
+    def append(self, ops: List[Dict[str, Any]]):
+        """Append ops durably. Call with `locked()` held, after catching up."""
+        if not ops:
+            return
+        data = "".join(json.dumps(op) + "\n" for op in ops).encode("utf-8")
+        with open(self.log_path, "ab") as f:
+            if f.tell() > self._offset:
+                # Torn tail from a writer that crashed mid-append: drop it
+                f.truncate(self._offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+
+    def compact(self, records: Iterable[Dict[str, Any]]):
+        """Atomically replace the snapshot and empty the log. Call with `locked()` held."""
+        tmp_path = self.write_snapshot(records)
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_dir(self.snapshot_path.parent)
+        # The snapshot now contains every logged op, so the log can start over
+        with open(self.log_path, "w"):
+            pass
+        self._snapshot_id = self._stat_snapshot()
+        self.snapshot_bytes = self._snapshot_size()
+        self._offset = 0
+
+    def write_snapshot(self, records: Iterable[Dict[str, Any]]) -> Path:
+        """Write records to a durable temporary file next to the snapshot. Needs no lock."""
+        fd, tmp_name = tempfile.mkstemp(dir=self.snapshot_path.parent, prefix=self.snapshot_path.stem + ".",
+                                        suffix=".tmp")
+        records = list(records)
+        try:
+            with open(fd, "w") as f:
+                f.write("[")
+                for start in range(0, len(records), SNAPSHOT_CHUNK):
+                    if start:
+                        f.write(",")
+                    f.write(json.dumps(records[start:start + SNAPSHOT_CHUNK])[1:-1])
+                f.write("]")
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return Path(tmp_name)
+
+    def swap_snapshot(self, tmp_path: Path, base: Tuple[Optional[Tuple[int, int]], int]) -> bool:
+        """Install a snapshot written by `write_snapshot()` with the records as of `base`
+        (a `position`), keeping the ops logged after it. Call with `locked()` held.
+
+        Returns False, and discards the file, if the snapshot changed since `base`.
+        """
+        base_snapshot, base_offset = base
+        size = self._log_size()
+        if self._stat_snapshot() != base_snapshot or size < base_offset:
+            os.unlink(tmp_path)
+            return False
+        with open(self.log_path, "rb") as f:
+            f.seek(base_offset)
+            tail = f.read(size - base_offset)
+        # A torn tail from a crashed writer is dropped, as the next append would
+        tail = tail[:tail.rfind(b"\n") + 1]
+
+        log_tmp_path = self.log_path.with_name(self.log_path.name + ".tmp")
+        with open(log_tmp_path, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        # Snapshot first: a crash in between leaves the new snapshot with the
+        # full old log, which replays harmlessly over it
+        os.replace(tmp_path, self.snapshot_path)
+        os.replace(log_tmp_path, self.log_path)
+        _fsync_dir(self.snapshot_path.parent)
+        self._snapshot_id = self._stat_snapshot()
+        self.snapshot_bytes = self._snapshot_size()
+        self._offset -= base_offset
+        return True
+
+
+def _fsync_dir(path: Path):
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def apply_op(records: Dict[str, Dict[str, Any]], op: Dict[str, Any]):
+    kind = op.get("op")
+    if kind == "put":
+        record = op["record"]
+        records[record["id"]] = record
+    elif kind == "patch":
+        record = records.get(op["id"])
+        if record is not None:
+            records[op["id"]] = {**record, **op["fields"]}
+    elif kind == "delete":
+        records.pop(op["id"], None)
+    elif kind in ("item_put", "item_delete"):
+        record = records.get(op["id"])
+        if record is not None:
+            records[op["id"]] = apply_item_op(record, op)
+
+
+def apply_item_op(record: Dict[str, Any], op: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of `record` with one item of a nested list (journal entries,
+    milestones) upserted or removed by item id."""
+    list_name = op["list"]
+    items = list(record.get(list_name) or [])
+    if op["op"] == "item_put":
+        item = op["item"]
+        for index, existing in enumerate(items):
+            if existing.get("id") == item["id"]:
+                items[index] = item
+                break
+        else:
+            items.append(item)
+    else:
+        items = [existing for existing in items if existing.get("id") != op["item_id"]]
+    return {**record, list_name: items}
@@ -1,73 +1,808 @@
-from ..models import DreamEntry
+from ..models import DreamEntry, JournalEntry, Milestone
+from .dream_stats import DreamStats
+from .metrics import metrics
+from .migrations import SCHEMA_VERSION, is_current, stamp, upgrade
+from .storage_engine import DreamLog, apply_item_op, apply_op
+import base64
 import json
 import os
-from typing import List, Dict, Any, Optional
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union
 from pathlib import Path
+from pydantic import BaseModel
 
 DATA_FILE = Path("data/dreams.json")
+LOG_FILE = Path("data/dreams.log")
+# Every owner other than the default one gets its own shard under data/users/<owner>/
+USERS_DIR = Path("data/users")
+DEFAULT_OWNER = "default"
+OWNER_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.@-]{0,63}$")
+# Compact once the log has grown to this fraction of the snapshot (and at least the minimum),
+# so the work a compaction does stays proportional to the writes it folds in
+COMPACT_LOG_RATIO = float(os.getenv("STORAGE_COMPACT_RATIO", "0.5"))
+COMPACT_MIN_BYTES = int(os.getenv("STORAGE_COMPACT_MIN_BYTES", str(1024 * 1024)))
+# Owners' shards kept in memory; the least recently used idle ones are unloaded beyond this
+MAX_LOADED_SHARDS = int(os.getenv("STORAGE_MAX_SHARDS", "256"))
+# How long the writer waits for more mutations to share one fsync
+GROUP_COMMIT_WINDOW = float(os.getenv("STORAGE_GROUP_COMMIT_MS", "2")) / 1000
+GROUP_COMMIT_MAX = int(os.getenv("STORAGE_GROUP_COMMIT_MAX", "256"))
+# Nested lists of a dream that can be changed one item at a time
+ITEM_MODELS = {"journal_entries": JournalEntry, "milestones": Milestone}
+
+# A change is an (old, new) pair of raw records: (None, new) for inserts,
+# (old, None) for deletes and (old, new) for updates
+Change = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+# A mutation inspects the current records and returns (log ops, changes, result)
+Mutation = Callable[["_Staged"], Tuple[List[Dict[str, Any]], List[Change], Any]]
+# Listeners are called with the owner whose records changed and the changes
+Listener = Callable[[str, List[Change]], None]
+
+
+def validate_owner(owner: Optional[str]) -> str:
+    """Normalize an owner key; None means the default owner. Raises ValueError for unsafe keys."""
+    if owner is None or owner == DEFAULT_OWNER:
+        return DEFAULT_OWNER
+    # Owner keys become directory names
+    if not OWNER_PATTERN.match(owner) or ".." in owner:
+        raise ValueError(f"Invalid owner key: {owner!r}")
+    return owner
+
+
+def _with_defaults(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill in model defaults for fields a stored record predates, without validating it."""
+    missing = [name for name in DreamEntry.model_fields if name not in record]
+    if not missing:
+        return record
+    record = dict(record)
+    for name in missing:
+        field = DreamEntry.model_fields[name]
+        if not field.is_required():
+            record[name] = field.get_default(call_default_factory=True)
+    return record
+
+
+def _matches(record: Dict[str, Any], category: Optional[str], completed: Optional[bool],
+             year: Optional[int]) -> bool:
+    if category is not None:
+        value = record.get("category")
+        if str(getattr(value, "value", value)) != category:
+            return False
+    if completed is not None and bool(record.get("completed", False)) != completed:
+        return False
+    if year is not None and record.get("suggested_target_year") != year:
+        return False
+    return True
+
+
+def _encode_cursor(position: int, anchor_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([position, anchor_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str, ids: List[str]) -> int:
+    """Where the next page starts: right after the anchor dream, wherever it has moved to."""
+    try:
+        position, anchor_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = int(position)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if 0 < position <= len(ids) and ids[position - 1] == anchor_id:
+        return position
+    try:
+        return ids.index(anchor_id) + 1
+    except ValueError:
+        # The anchor was deleted: resume at the same offset
+        return min(max(position, 0), len(ids))
+
+
+def _upgrade_all(records: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Bring freshly loaded records to the current schema; compaction persists the result."""
+    for dream_id, record in records.items():
+        if not is_current(record):
+            records[dream_id] = upgrade(record)
+    return records
+
+
+def owner_path(owner: Optional[str], filename: str) -> Path:
+    """Where one owner's file lives; the default owner keeps the original data/ layout."""
+    owner = validate_owner(owner)
+    if owner == DEFAULT_OWNER:
+        return DATA_FILE.parent / filename
+    return USERS_DIR / owner / filename
+
+
+class _Staged:
+    """A shard's records with the changes of a commit in progress on top.
+
+    Mutations of one group commit see each other's changes through it, while
+    readers keep seeing the shard's records until the commit is durable.
+    """
+
+    def __init__(self, records: Dict[str, Dict[str, Any]]):
+        self._records = records
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def get(self, dream_id: str) -> Optional[Dict[str, Any]]:
+        if dream_id in self._pending:
+            return self._pending[dream_id]
+        return self._records.get(dream_id)
+
+    def __getitem__(self, dream_id: str) -> Dict[str, Any]:
+        record = self.get(dream_id)
+        if record is None:
+            raise KeyError(dream_id)
+        return record
+
+    def __contains__(self, dream_id: str) -> bool:
+        return self.get(dream_id) is not None
+
+    def apply(self, changes: List[Change]):
+        for old_raw, new_raw in changes:
+            if new_raw is None:
+                self._pending[old_raw["id"]] = None
+            else:
+                self._pending[new_raw["id"]] = new_raw
+
+
+class _Shard:
+    """One owner's dreams: a snapshot and log on disk, every record in memory keyed by id.
+
+    `lock` guards the in-memory state. The writer holds it only to catch up
+    and to publish a commit, not while appending to the log, so readers of
+    the shard never wait on an fsync.
+    """
+
+    def __init__(self, owner: str):
+        self.owner = owner
+        self.snapshot_path = owner_path(owner, DATA_FILE.name)
+        self.log = DreamLog(self.snapshot_path, owner_path(owner, LOG_FILE.name))
+        self.lock = threading.RLock()
+        # Set while this process holds the file lock to change the files and memory
+        # doesn't reflect them yet (a commit not yet published, a snapshot swap)
+        self.writing = False
+        # Queued for, or running, a background compaction
+        self.compacting = False
+        # Mutations submitted and not committed yet; guarded by the service's lock
+        self.queued_writes = 0
+        self.last_used = time.monotonic()
+        with metrics.timer("storage_stage_seconds", stage="load"):
+            self.records: Dict[str, Dict[str, Any]] = _upgrade_all(self.log.load())
+        # Log position the in-memory records reflect
+        self.position = self.log.position
+        self._order: Optional[Tuple[str, List[str]]] = None
+        self.stats = DreamStats(self.records.values())
+        # id -> (raw record, validated model, serialized JSON). Records are never
+        # mutated in place, so an entry is current exactly while its raw dict is
+        self._validated: Dict[str, Tuple[Dict[str, Any], DreamEntry, Optional[bytes]]] = {}
+
+    def model(self, record: Dict[str, Any]) -> DreamEntry:
+        """The validated model of a stored record, built once per record version."""
+        cached = self._validated.get(record["id"])
+        if cached is not None and cached[0] is record:
+            return cached[1]
+        model = DreamEntry(**record)
+        self._validated[record["id"]] = (record, model, None)
+        return model
+
+    def json(self, record: Dict[str, Any]) -> bytes:
+        """The record serialized as the API returns it, built once per record version."""
+        cached = self._validated.get(record["id"])
+        if cached is not None and cached[0] is record and cached[2] is not None:
+            return cached[2]
+        model = self.model(record)
+        data = model.model_dump_json().encode("utf-8")
+        self._validated[record["id"]] = (record, model, data)
+        return data
+
+    def remember(self, record: Dict[str, Any], model: DreamEntry):
+        """Cache a model validated at write time."""
+        self._validated[record["id"]] = (record, model, None)
+
+    def forget(self, changes: List[Change]):
+        for old_raw, new_raw in changes:
+            if new_raw is None and old_raw is not None:
+                self._validated.pop(old_raw["id"], None)
+
+    def version(self) -> str:
+        """Changes with every write, and agrees across processes that have caught up."""
+        snapshot_id, offset = self.position
+        inode, mtime = snapshot_id or (0, 0)
+        return f"{inode:x}-{mtime:x}-{offset:x}"
+
+    def ordered_ids(self) -> List[str]:
+        """Ids in storage order, rebuilt only when the shard has changed."""
+        version = self.version()
+        if self._order is None or self._order[0] != version:
+            self._order = (version, list(self.records))
+        return self._order[1]
+
+    def ensure_files(self):
+        if not self.snapshot_path.parent.exists():
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Exclusive create, so concurrent workers never clobber each other's snapshot
+            with open(self.snapshot_path, "x") as f:
+                json.dump([], f)
+        except FileExistsError:
+            pass
+
+    def reload(self) -> List[Change]:
+        """Replace the records with what the files say; returns what differs."""
+        old_records = self.records
+        self.records = _upgrade_all(self.log.load())
+        self.position = self.log.position
+        self.stats = DreamStats(self.records.values())
+        ids = set(old_records) | set(self.records)
+        changes = [
+            (old_records.get(i), self.records.get(i))
+            for i in ids
+            if old_records.get(i) != self.records.get(i)
+        ]
+        self.forget(changes)
+        return changes
+
+    def catch_up(self) -> List[Change]:
+        """Apply writes made by other processes since we last looked at the log. Call with `lock` held."""
+        ops = self.log.read_new_ops()
+        if ops is None:
+            return self.reload()
+
+        changes = []
+        for op in ops:
+            dream_id = op["record"]["id"] if op.get("op") == "put" else op.get("id")
+            old_raw = self.records.get(dream_id)
+            apply_op(self.records, op)
+            new_raw = self.records.get(dream_id)
+            if new_raw is not None and not is_current(new_raw):
+                # Written by a process that predates the current schema
+                new_raw = self.records[dream_id] = upgrade(new_raw)
+            if old_raw is not new_raw:
+                changes.append((old_raw, new_raw))
+        self.position = self.log.position
+        self.stats.apply(changes)
+        self.forget(changes)
+        return changes
+
+    def needs_compaction(self) -> bool:
+        return self.log.log_bytes >= max(COMPACT_MIN_BYTES, COMPACT_LOG_RATIO * self.log.snapshot_bytes)
+
+    def publish(self, changes: List[Change]):
+        """Make a durable commit visible to readers. Call with `lock` held."""
+        for old_raw, new_raw in changes:
+            if new_raw is None:
+                self.records.pop(old_raw["id"], None)
+            else:
+                self.records[new_raw["id"]] = new_raw
+        self.position = self.log.position
+        self.stats.apply(changes)
+        self.forget(changes)
+
 
 class StorageService:
+    """Dream records partitioned by owner.
+
+    Every public method takes an optional `owner`; each owner's dreams are a
+    separate shard (own snapshot, log and lock), loaded on first use, so a
+    request only ever reads or validates its owner's records, and never
+    waits on another owner's writes. Without an owner the default shard in
+    data/dreams.json is used, as before.
+    """
+
     def __init__(self):
+        self._listeners: List[Listener] = []
+        # Guards the shard registry and the writer thread; each shard has its own lock,
+        # and mutations only ever run on the writer thread
+        self._lock = threading.RLock()
+        self._shards: Dict[str, _Shard] = {}
+        self._queue: "queue.Queue[Tuple[_Shard, Mutation, Future]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._compactions: "queue.Queue[_Shard]" = queue.Queue()
+        self._compactor: Optional[threading.Thread] = None
         self._ensure_data_file()
+        self._shard(DEFAULT_OWNER)
+
+    def subscribe(self, listener: Listener):
+        """Register a callback invoked with (owner, changes) after every write.
+
+        Listeners run on the writer thread and hold up the next commit, so
+        they must hand anything slow off to another thread.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, owner: str, changes: List[Change]):
+        for listener in self._listeners:
+            try:
+                listener(owner, changes)
+            except Exception as e:
+                print(f"Storage listener {listener} failed: {e}")
 
     def _ensure_data_file(self):
         if not DATA_FILE.parent.exists():
-            DATA_FILE.parent.mkdir(parents=True)
-        if not DATA_FILE.exists():
-            with open(DATA_FILE, "w") as f:
+            DATA_FILE.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Exclusive create, so concurrent workers never clobber each other's snapshot
+            with open(DATA_FILE, "x") as f:
                 json.dump([], f)
+        except FileExistsError:
+            pass
+
+    def _shard(self, owner: Optional[str] = None) -> _Shard:
+        owner = validate_owner(owner)
+        shard = self._shards.get(owner)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(owner)
+                if shard is None:
+                    self._evict_shards()
+                    shard = _Shard(owner)
+                    self._shards[owner] = shard
+        shard.last_used = time.monotonic()
+        return shard
+
+    def _evict_shards(self):
+        """Unload the least recently used idle shards to make room for one more. Call with `_lock` held.
+
+        Owner keys come from a request header, so without this every owner
+        ever seen would stay in memory. Shards with writes queued or in
+        flight, or a compaction pending, are kept: the limit is soft.
+        """
+        excess = len(self._shards) + 1 - MAX_LOADED_SHARDS
+        if excess <= 0:
+            return
+        idle = [shard for shard in self._shards.values()
+                if shard.owner != DEFAULT_OWNER and not shard.queued_writes and not shard.writing
+                and not shard.compacting]
+        for shard in sorted(idle, key=lambda shard: shard.last_used)[:excess]:
+            # Anyone still holding it reads a consistent, if aging, view; the files stay the truth
+            del self._shards[shard.owner]
+            metrics.inc("storage_shards_evicted_total")
+
+    def refresh(self, owner: Optional[str] = None):
+        """Pick up writes made by other processes (and notify listeners of them)."""
+        shard = self._shard(owner)
+        with shard.lock, metrics.timer("storage_stage_seconds", stage="catch_up"):
+            # A commit in progress holds the file lock, so no other process can have
+            # written since it caught up; its own ops become visible when it publishes
+            changes = [] if shard.writing else shard.catch_up()
+        if changes:
+            self._notify(shard.owner, changes)
 
-    def load_dreams_raw(self) -> List[Dict[str, Any]]:
-        with open(DATA_FILE, "r") as f:
+    def _submit(self, shard: _Shard, mutation: Mutation) -> Any:
+        """Queue a mutation for the writer thread and wait until it is durable."""
+        future: Future = Future()
+        with self._lock:
+            shard.queued_writes += 1
+        self._queue.put((shard, mutation, future))
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="storage-writer", daemon=True)
+                self._writer.start()
+        return future.result()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            # One commit (and fsync) per shard touched by the batch, in arrival order
+            by_shard: Dict[str, List[Tuple[Mutation, Future]]] = {}
+            shards: Dict[str, _Shard] = {}
+            for shard, mutation, future in batch:
+                shards[shard.owner] = shard
+                by_shard.setdefault(shard.owner, []).append((mutation, future))
+            for owner, shard_batch in by_shard.items():
+                try:
+                    self._commit(shards[owner], shard_batch)
+                except Exception as e:
+                    print(f"Storage commit failed: {e}")
+                    for _, future in shard_batch:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    with self._lock:
+                        shards[owner].queued_writes -= len(shard_batch)
+
+    def _commit(self, shard: _Shard, batch: List[Tuple[Mutation, Future]]):
+        """Run a group of mutations under the cross-process lock and persist them with one fsync.
+
+        Readers only wait for the catch-up before the mutations and for
+        publishing their changes after the append, never for the fsync.
+        """
+        ops: List[Dict[str, Any]] = []
+        changes: List[Change] = []
+        written: List[Change] = []
+        outcomes: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        shard.ensure_files()
+        with shard.log.locked():
+            with shard.lock:
+                changes.extend(shard.catch_up())
+                shard.writing = True
             try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
-
-    def get_all_dreams(self) -> List[DreamEntry]:
-        raw = self.load_dreams_raw()
-        return [DreamEntry(**d) for d in raw]
-
-    def get_dream_by_id(self, dream_id: str) -> Optional[DreamEntry]:
-        dreams = self.get_all_dreams()
-        for d in dreams:
-            if d.id == dream_id:
-                return d
-        return None
-
-    def save_dreams(self, dreams: List[Dict[str, Any]]):
-        current_raw = self.load_dreams_raw()
-        current_raw.extend(dreams)
-        with open(DATA_FILE, "w") as f:
-            json.dump(current_raw, f, indent=2)
-
-    def update_dream(self, dream_id: str, updates: Dict[str, Any]) -> Optional[DreamEntry]:
-        raw_dreams = self.load_dreams_raw()
-        updated_raw = None
-        
-        for d in raw_dreams:
-            if d.get("id") == dream_id:
-                # Update but preserve ID
-                d.update({k: v for k, v in updates.items() if v is not None})
-                updated_raw = d
-                break
-        
-        if updated_raw:
-            with open(DATA_FILE, "w") as f:
-                json.dump(raw_dreams, f, indent=2)
-            return DreamEntry(**updated_raw)
-                
-        return None
-
-    def delete_dream(self, dream_id: str) -> bool:
-        raw_dreams = self.load_dreams_raw()
-        new_dreams = [d for d in raw_dreams if d.get("id") != dream_id]
-        
-        if len(new_dreams) < len(raw_dreams):
-            with open(DATA_FILE, "w") as f:
-                json.dump(new_dreams, f, indent=2)
-            return True
-        return False
+                staged = _Staged(shard.records)
+                for mutation, future in batch:
+                    try:
+                        mutation_ops, mutation_changes, result = mutation(staged)
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                        continue
+                    staged.apply(mutation_changes)
+                    ops.extend(mutation_ops)
+                    written.extend(mutation_changes)
+                    outcomes.append((future, result, None))
 
-storage_service = StorageService()
+                try:
+                    with metrics.timer("storage_stage_seconds", stage="append"):
+                        shard.log.append(ops)
+                except Exception as e:
+                    # Nothing reached disk: make sure memory matches what the files say
+                    with shard.lock:
+                        changes.extend(shard.reload())
+                    for mutation, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    self._notify(shard.owner, changes)
+                    return
+
+                with shard.lock:
+                    shard.publish(written)
+                    changes.extend(written)
+            finally:
+                shard.writing = False
+
+        if not shard.compacting and shard.needs_compaction():
+            self._schedule_compaction(shard)
+
+        metrics.observe("storage_commit_batch_size", len(batch))
+        for op in ops:
+            metrics.inc("storage_log_ops_total", op=op["op"])
+
+        # Writers don't wait for the listeners (search indexing) once their data is durable
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        self._notify(shard.owner, changes)
+
+    def _schedule_compaction(self, shard: _Shard):
+        """Compact a shard on the compactor thread, off the commit path."""
+        shard.compacting = True
+        self._compactions.put(shard)
+        with self._lock:
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self._compact_loop, name="storage-compactor", daemon=True)
+                self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            shard = self._compactions.get()
+            try:
+                self._compact(shard)
+            except Exception as e:
+                print(f"Compacting {shard.owner} failed: {e}")
+            finally:
+                shard.compacting = False
+
+    def _compact(self, shard: _Shard) -> bool:
+        """Fold a shard's log into its snapshot without blocking its readers or writers.
+
+        The snapshot is written from the in-memory records while commits go
+        on; only swapping it in takes the file lock, carrying over whatever
+        was logged meanwhile. False if another process compacted first.
+        """
+        with shard.lock:
+            records = list(shard.records.values())
+            base = shard.position
+        with metrics.timer("storage_stage_seconds", stage="compact"):
+            tmp_path = shard.log.write_snapshot(records)
+        with shard.log.locked():
+            with shard.lock:
+                # No commit can be in flight while we hold the file lock, so memory
+                # matches the log; readers stop tailing it while the files change
+                shard.writing = True
+            try:
+                with metrics.timer("storage_stage_seconds", stage="compact_swap"):
+                    swapped = shard.log.swap_snapshot(tmp_path, base)
+                with shard.lock:
+                    shard.position = shard.log.position
+            finally:
+                shard.writing = False
+        return swapped
+
+    def compact(self):
+        """Fold the operation log of every loaded shard back into its JSON snapshot."""
+        for shard in list(self._shards.values()):
+            if not shard.snapshot_path.parent.exists():
+                continue
+            self.refresh(shard.owner)
+            if shard.log.log_bytes:
+                self._compact(shard)
+
+    def load_dreams_raw(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        # Served from the in-memory index; callers must treat the records as read-only
+        self.refresh(owner)
+        return list(self._shard(owner).records.values())
+
+    def version(self, owner: Optional[str] = None) -> str:
+        """Opaque version of an owner's dreams, e.g. for ETags."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        with shard.lock:
+            return shard.version()
+
+    def stats(self, owner: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+        """Dashboard aggregates of an owner's dreams and the version they describe."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        with shard.lock:
+            return shard.stats.as_dict(), shard.version()
+
+    def _page(self, shard: _Shard, category: Optional[str], completed: Optional[bool], year: Optional[int],
+              cursor: Optional[str], limit: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[str], str]:
+        with shard.lock:
+            version = shard.version()
+            ids = shard.ordered_ids()
+            position = _decode_cursor(cursor, ids) if cursor else 0
+            page = []
+            while position < len(ids) and (limit is None or len(page) < limit):
+                record = shard.records[ids[position]]
+                position += 1
+                if _matches(record, category, completed, year):
+                    page.append(record)
+            next_cursor = _encode_cursor(position, ids[position - 1]) if position < len(ids) else None
+        return page, next_cursor, version
+
+    def list_dreams(self, owner: Optional[str] = None, category: Optional[str] = None,
+                    completed: Optional[bool] = None, year: Optional[int] = None,
+                    fields: Optional[List[str]] = None, cursor: Optional[str] = None,
+                    limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str], str]:
+        """One page of an owner's dreams as plain dicts, in storage order, without model validation.
+
+        Returns (records, next_cursor, version); next_cursor is None on the
+        last page. `fields` projects every record onto just those keys.
+        """
+        self.refresh(owner)
+        page, next_cursor, version = self._page(self._shard(owner), category, completed, year, cursor, limit)
+        page = [_with_defaults(record) for record in page]
+        if fields is not None:
+            page = [{name: record.get(name) for name in fields} for record in page]
+        return page, next_cursor, version
+
+    def list_dreams_json(self, owner: Optional[str] = None, category: Optional[str] = None,
+                         completed: Optional[bool] = None, year: Optional[int] = None,
+                         cursor: Optional[str] = None,
+                         limit: Optional[int] = None) -> Tuple[bytes, Optional[str], str]:
+        """Like list_dreams() with every field, as a ready-to-send JSON array of cached record bytes."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        page, next_cursor, version = self._page(shard, category, completed, year, cursor, limit)
+        with metrics.timer("storage_stage_seconds", stage="serialize"):
+            data = b"[" + b",".join(shard.json(record) for record in page) + b"]"
+        return data, next_cursor, version
+
+    def export_ndjson(self, owner: Optional[str] = None, cursor: Optional[str] = None,
+                      limit: Optional[int] = None) -> Tuple[bytes, Optional[str]]:
+        """One page of dreams as NDJSON lines, each with its schema_version, and the next cursor."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        page, next_cursor, _ = self._page(shard, None, None, None, cursor, limit)
+        # Cached model JSON always starts with "{", so the version is spliced in without re-serializing
+        prefix = b'{"schema_version":%d,' % SCHEMA_VERSION
+        return b"".join(prefix + shard.json(record)[1:] + b"\n" for record in page), next_cursor
+
+    # Models returned by the getters below are cached and shared between
+    # callers: treat them as read-only, like the raw records
 
+    def get_all_dreams(self, owner: Optional[str] = None) -> List[DreamEntry]:
+        shard = self._shard(owner)
+        return [shard.model(d) for d in self.load_dreams_raw(owner)]
+
+    def get_dreams_by_ids(self, dream_ids: List[str], owner: Optional[str] = None) -> Dict[str, DreamEntry]:
+        """Models of the requested records, keyed by id."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        records = shard.records
+        return {i: shard.model(records[i]) for i in dream_ids if i in records}
+
+    def get_dream_by_id(self, dream_id: str, owner: Optional[str] = None) -> Optional[DreamEntry]:
+        self.refresh(owner)
+        shard = self._shard(owner)
+        record = shard.records.get(dream_id)
+        return shard.model(record) if record is not None else None
+
+    def get_dream_json(self, dream_id: str, owner: Optional[str] = None) -> Optional[bytes]:
+        """The dream serialized as JSON, from cache when it hasn't changed."""
+        self.refresh(owner)
+        shard = self._shard(owner)
+        record = shard.records.get(dream_id)
+        return shard.json(record) if record is not None else None
+
+    def save_dreams(self, dreams: List[Union[Dict[str, Any], DreamEntry]], owner: Optional[str] = None):
+        """Insert or replace dreams. DreamEntry instances are trusted as already
+        validated; plain dicts are validated here, once, so reads can trust the cache."""
+        shard = self._shard(owner)
+        entries = [(stamp(d.model_dump()), d) if isinstance(d, DreamEntry) else (upgrade(d), None) for d in dreams]
+
+        def mutation(records):
+            # An id repeated within one save keeps its last record, as replaying the puts would
+            saved: Dict[str, Dict[str, Any]] = {}
+            for record, model in entries:
+                shard.remember(record, model if model is not None else DreamEntry(**record))
+                saved[record["id"]] = record
+            changes = [(records.get(dream_id), d) for dream_id, d in saved.items()]
+            return [{"op": "put", "record": d} for d in saved.values()], changes, None
+        self._submit(shard, mutation)
+
+    def update_dream(self, dream_id: str, updates: Dict[str, Any], owner: Optional[str] = None) -> Optional[DreamEntry]:
+        shard = self._shard(owner)
+        # Update but preserve ID
+        fields = {k: v for k, v in updates.items() if v is not None and k != "id"}
+
+        def mutation(records):
+            old_raw = records.get(dream_id)
+            if old_raw is None:
+                return [], [], None
+            updated_raw = {**old_raw, **fields}
+            model = DreamEntry(**updated_raw)
+            shard.remember(updated_raw, model)
+            return [{"op": "patch", "id": dream_id, "fields": fields}], [(old_raw, updated_raw)], model
+
+        return self._submit(shard, mutation)
+
+    def update_dreams(self, updates: Dict[str, Dict[str, Any]], owner: Optional[str] = None) -> List[DreamEntry]:
+        """Apply updates to several dreams as one transaction (one log append, one fsync)."""
+        shard = self._shard(owner)
+
+        def mutation(records):
+            ops, changes, updated = [], [], []
+            for dream_id, dream_updates in updates.items():
+                old_raw = records.get(dream_id)
+                if old_raw is None:
+                    continue
+                fields = {k: v for k, v in dream_updates.items() if v is not None and k != "id"}
+                updated_raw = {**old_raw, **fields}
+                model = DreamEntry(**updated_raw)
+                shard.remember(updated_raw, model)
+                ops.append({"op": "patch", "id": dream_id, "fields": fields})
+                changes.append((old_raw, updated_raw))
+                updated.append(model)
+            return ops, changes, updated
+
+        return self._submit(shard, mutation)
+
+    def _item_mutation(self, shard: _Shard, records: _Staged, dream_id: str, list_name: str, op: Dict[str, Any],
+                       item: Optional[BaseModel], result: Any) -> Tuple[List[Dict[str, Any]], List[Change], Any]:
+        """Apply an item op to a dream, caching the new model without re-validating the whole dream."""
+        old_raw = records[dream_id]
+        new_raw = apply_item_op(old_raw, op)
+        old_model = shard.model(old_raw)
+        items = list(getattr(old_model, list_name))
+        if item is None:
+            items = [i for i in items if i.id != op["item_id"]]
+        else:
+            position = next((n for n, i in enumerate(items) if i.id == item.id), None)
+            if position is None:
+                items.append(item)
+            else:
+                items[position] = item
+        shard.remember(new_raw, old_model.model_copy(update={list_name: items}))
+        return [op], [(old_raw, new_raw)], result
+
+    def put_item(self, dream_id: str, list_name: str, item: Dict[str, Any],
+                 owner: Optional[str] = None) -> Optional[BaseModel]:
+        """Append a journal entry or milestone, or replace the one with the same id.
+        Only the item is logged, not the dream. None if the dream doesn't exist."""
+        shard = self._shard(owner)
+        model = ITEM_MODELS[list_name](**item)
+        item_raw = model.model_dump()
+
+        def mutation(records):
+            if dream_id not in records:
+                return [], [], None
+            op = {"op": "item_put", "id": dream_id, "list": list_name, "item": item_raw}
+            return self._item_mutation(shard, records, dream_id, list_name, op, model, model)
+        return self._submit(shard, mutation)
+
+    def update_item(self, dream_id: str, list_name: str, item_id: str, updates: Dict[str, Any],
+                    owner: Optional[str] = None) -> Optional[BaseModel]:
+        """Change some fields of one journal entry or milestone. None if either doesn't exist."""
+        shard = self._shard(owner)
+        fields = {k: v for k, v in updates.items() if v is not None and k != "id"}
+
+        def mutation(records):
+            old_raw = records.get(dream_id)
+            if old_raw is None:
+                return [], [], None
+            existing = next((i for i in old_raw.get(list_name) or [] if i.get("id") == item_id), None)
+            if existing is None:
+                return [], [], None
+            model = ITEM_MODELS[list_name](**{**existing, **fields})
+            # The whole item is logged, so replaying the op twice is harmless
+            op = {"op": "item_put", "id": dream_id, "list": list_name, "item": model.model_dump()}
+            return self._item_mutation(shard, records, dream_id, list_name, op, model, model)
+        return self._submit(shard, mutation)
+
+    def delete_item(self, dream_id: str, list_name: str, item_id: str, owner: Optional[str] = None) -> bool:
+        shard = self._shard(owner)
+
+        def mutation(records):
+            old_raw = records.get(dream_id)
+            if old_raw is None or not any(i.get("id") == item_id for i in old_raw.get(list_name) or []):
+                return [], [], False
+            op = {"op": "item_delete", "id": dream_id, "list": list_name, "item_id": item_id}
+            return self._item_mutation(shard, records, dream_id, list_name, op, None, True)
+        return self._submit(shard, mutation)
+
+    def merge_dreams(self, merges: List[Tuple[str, DreamEntry]],
+                     owner: Optional[str] = None) -> List[Optional[DreamEntry]]:
+        """Fold duplicate dreams into existing ones, as one transaction.
+
+        Each (target_id, duplicate) appends the duplicate's milestones and
+        journal entries the target doesn't have yet (same id or same text) as
+        item ops, and fills in smart_data and notes when the target has none.
+        Returns the merged target of each pair, None if it no longer exists.
+        """
+        shard = self._shard(owner)
+        item_keys = {"milestones": "title", "journal_entries": "content"}
+
+        def mutation(records):
+            ops: List[Dict[str, Any]] = []
+            originals: Dict[str, Dict[str, Any]] = {}
+            current: Dict[str, Dict[str, Any]] = {}
+            targets: List[Optional[str]] = []
+            for target_id, duplicate in merges:
+                raw = current.get(target_id) or records.get(target_id)
+                if raw is None:
+                    targets.append(None)
+                    continue
+                originals.setdefault(target_id, raw)
+                for list_name, key in item_keys.items():
+                    existing = raw.get(list_name) or []
+                    seen = {i.get("id") for i in existing} | {(i.get(key) or "").strip().lower() for i in existing}
+                    for item in getattr(duplicate, list_name):
+                        text = (getattr(item, key) or "").strip().lower()
+                        if item.id in seen or text in seen:
+                            continue
+                        op = {"op": "item_put", "id": target_id, "list": list_name, "item": item.model_dump()}
+                        raw = apply_item_op(raw, op)
+                        ops.append(op)
+                        seen.update((item.id, text))
+                fields: Dict[str, Any] = {}
+                if raw.get("smart_data") is None and duplicate.smart_data is not None:
+                    fields["smart_data"] = duplicate.smart_data.model_dump()
+                    fields["is_polished"] = duplicate.is_polished
+                if not raw.get("notes") and duplicate.notes:
+                    fields["notes"] = duplicate.notes
+                if fields:
+                    ops.append({"op": "patch", "id": target_id, "fields": fields})
+                    raw = {**raw, **fields}
+                current[target_id] = raw
+                targets.append(target_id)
+
+            changes: List[Change] = []
+            for target_id, raw in current.items():
+                if raw is not originals[target_id]:
+                    shard.remember(raw, DreamEntry(**raw))
+                    changes.append((originals[target_id], raw))
+            return ops, changes, [shard.model(current[t]) if t else None for t in targets]
+        return self._submit(shard, mutation)
+
+    def delete_dream(self, dream_id: str, owner: Optional[str] = None) -> bool:
+        shard = self._shard(owner)
+
+        def mutation(records):
+            old_raw = records.get(dream_id)
+            if old_raw is None:
+                return [], [], False
+            return [{"op": "delete", "id": dream_id}], [(old_raw, None)], True
+        return self._submit(shard, mutation)
+
+storage_service = StorageService()
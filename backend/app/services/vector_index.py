@@ -0,0 +1,357 @@
+import numpy as np
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Iterable
+from .embedding_store import EmbeddingStore
+
+IVF_FILE = Path("data/ivf_index.npz")
+HNSW_FILE = Path("data/hnsw_index.bin")
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    if k <= 0 or scores.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ExactIndex:
+    """Brute-force cosine ranking over every row of the embedding store.
+
+    Also the base for the approximate indexes: they only narrow down which
+    rows get scored, and are kept in sync through add/remove by dream id.
+    """
+
+    name = "exact"
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+
+    def add(self, ids: Iterable[str]):
+        pass
+
+    def remove(self, ids: Iterable[str]):
+        pass
+
+    def load(self):
+        pass
+
+    def save(self):
+        pass
+
+    def search(self, query: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the k best rows for a unit-normalized query."""
+        if mask is not None:
+            return self._score_rows(np.flatnonzero(mask), query, k, None)
+        scores = self.store.score(query)
+        best = top_k(scores, max(k, self.store.rerank_candidates))
+        return self._rerank(best, scores[best], query, k)
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray, k: int,
+                    mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        if mask is not None:
+            rows = rows[mask[rows]]
+        scores = self.store.score(query, rows)
+        best = top_k(scores, max(k, self.store.rerank_candidates))
+        return self._rerank(rows[best], scores[best], query, k)
+
+    def _rerank(self, rows: np.ndarray, scores: np.ndarray, query: np.ndarray,
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-score quantized candidates with their float32 vectors and keep the k best."""
+        if self.store.rerank_candidates:
+            exact = self.store.exact_scores(rows, query)
+            if exact is not None:
+                scores = exact
+                order = top_k(scores, k)
+                return rows[order], scores[order]
+        return rows[:k], scores[:k]
+
+
+class IVFIndex(ExactIndex):
+    """Inverted-file index: rows are bucketed by their nearest k-means centroid
+    and a query only scores the buckets of its `nprobe` closest centroids.
+
+    Knobs (env): SEARCH_IVF_NLIST (0 = sqrt(n)), SEARCH_IVF_NPROBE and
+    SEARCH_IVF_MIN_TRAIN, below which the index falls back to exact search.
+    """
+
+    name = "ivf"
+
+    def __init__(self, store: EmbeddingStore, path: Path = IVF_FILE):
+        super().__init__(store)
+        self.path = path
+        self.nlist = int(os.getenv("SEARCH_IVF_NLIST", "0"))
+        self.nprobe = int(os.getenv("SEARCH_IVF_NPROBE", "8"))
+        self.min_train_size = int(os.getenv("SEARCH_IVF_MIN_TRAIN", "2048"))
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[set] = []
+        self.assignment: Dict[str, int] = {}
+        self.trained_size = 0
+        self._dirty = False
+
+    def train(self, iterations: int = 10, seed: int = 0):
+        n = len(self.store)
+        nlist = min(self.nlist or max(1, int(math.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        # Spherical k-means on a bounded sample keeps training cost independent of n
+        sample = self.store.vectors(rng.choice(n, size=min(n, nlist * 64), replace=False))
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms == 0, 1, norms)
+
+        self.centroids = centroids
+        self.lists = [set() for _ in range(nlist)]
+        self.assignment = {}
+        self.trained_size = n
+        self._assign(self.store.ids)
+        print(f"Trained IVF index with {nlist} lists over {n} embeddings")
+
+    def _assign(self, ids: List[str]):
+        rows = [self.store.row(i) for i in ids]
+        pairs = [(i, r) for i, r in zip(ids, rows) if r is not None]
+        for start in range(0, len(pairs), 8192):
+            chunk = pairs[start:start + 8192]
+            vectors = self.store.vectors([r for _, r in chunk])
+            labels = np.argmax(vectors @ self.centroids.T, axis=1)
+            for (dream_id, _), label in zip(chunk, labels):
+                previous = self.assignment.get(dream_id)
+                if previous is not None:
+                    self.lists[previous].discard(dream_id)
+                self.assignment[dream_id] = int(label)
+                self.lists[label].add(dream_id)
+        self._dirty = True
+
+    def add(self, ids: Iterable[str]):
+        ids = list(ids)
+        if self.centroids is None:
+            if len(self.store) >= self.min_train_size:
+                self.train()
+            return
+        # Centroids drift from the data as the corpus grows; retrain periodically
+        if len(self.store) > 4 * self.trained_size:
+            self.train()
+            return
+        self._assign(ids)
+
+    def remove(self, ids: Iterable[str]):
+        for dream_id in ids:
+            label = self.assignment.pop(dream_id, None)
+            if label is not None:
+                self.lists[label].discard(dream_id)
+                self._dirty = True
+
+    def search(self, query: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if self.centroids is None:
+            return super().search(query, k, mask)
+        probes = top_k(self.centroids @ query, self.nprobe)
+        rows = [self.store.row(dream_id) for p in probes for dream_id in self.lists[p]]
+        rows = np.array([r for r in rows if r is not None], dtype=np.int64)
+        return self._score_rows(rows, query, k, mask)
+
+    def save(self):
+        if not self._dirty or self.centroids is None:
+            return
+        ids = list(self.assignment.keys())
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                ids=np.array(ids, dtype=str),
+                labels=np.array([self.assignment[i] for i in ids], dtype=np.int32),
+                trained_size=np.array(self.trained_size),
+            )
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def load(self):
+        if self.path.exists():
+            try:
+                with np.load(self.path, allow_pickle=False) as data:
+                    centroids = data["centroids"].astype(np.float32)
+                    ids = [str(i) for i in data["ids"]]
+                    labels = data["labels"].tolist()
+                    trained_size = int(data["trained_size"])
+                if self.store.dim == centroids.shape[1]:
+                    self.centroids = centroids
+                    self.lists = [set() for _ in range(centroids.shape[0])]
+                    self.assignment = {}
+                    self.trained_size = trained_size
+                    for dream_id, label in zip(ids, labels):
+                        self.assignment[dream_id] = label
+                        self.lists[label].add(dream_id)
+            except Exception as e:
+                print(f"Failed to load IVF index from {self.path}: {e}")
+
+        # Reconcile with the store, which may have been saved at a different time
+        self.remove([i for i in list(self.assignment) if i not in self.store])
+        self.add([i for i in self.store.ids if i not in self.assignment])
+
+
+class HNSWIndex(ExactIndex):
+    """Graph index backed by the optional `hnswlib` package.
+
+    Knobs (env): SEARCH_HNSW_M, SEARCH_HNSW_EF_CONSTRUCTION and SEARCH_HNSW_EF.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, store: EmbeddingStore, path: Path = HNSW_FILE):
+        import hnswlib
+        super().__init__(store)
+        self._hnswlib = hnswlib
+        self.path = path
+        self.m = int(os.getenv("SEARCH_HNSW_M", "16"))
+        self.ef_construction = int(os.getenv("SEARCH_HNSW_EF_CONSTRUCTION", "200"))
+        self.ef = int(os.getenv("SEARCH_HNSW_EF", "64"))
+        self._index = None
+        self.labels: Dict[str, int] = {}
+        self.label_ids: Dict[int, str] = {}
+        self._next_label = 0
+        self._dirty = False
+
+    def _ensure_capacity(self, dim: int, needed: int):
+        if self._index is None:
+            self._index = self._hnswlib.Index(space="ip", dim=dim)
+            self._index.init_index(max_elements=max(needed, 1024), M=self.m,
+                                   ef_construction=self.ef_construction)
+            self._index.set_ef(self.ef)
+        elif needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+
+    def add(self, ids: Iterable[str]):
+        pairs = [(i, self.store.row(i)) for i in ids]
+        pairs = [(i, r) for i, r in pairs if r is not None]
+        if not pairs:
+            return
+        labels = []
+        for dream_id, _ in pairs:
+            if dream_id not in self.labels:
+                self.labels[dream_id] = self._next_label
+                self.label_ids[self._next_label] = dream_id
+                self._next_label += 1
+            labels.append(self.labels[dream_id])
+        vectors = self.store.vectors([r for _, r in pairs])
+        self._ensure_capacity(vectors.shape[1], self._next_label)
+        self._index.add_items(vectors, np.array(labels))
+        self._dirty = True
+
+    def remove(self, ids: Iterable[str]):
+        for dream_id in ids:
+            label = self.labels.pop(dream_id, None)
+            if label is not None:
+                del self.label_ids[label]
+                self._index.mark_deleted(label)
+                self._dirty = True
+
+    def search(self, query: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self.labels))
+        if self._index is None or k == 0:
+            return super().search(query, k, mask)
+
+        def allowed(label: int) -> bool:
+            row = self.store.row(self.label_ids.get(label))
+            return row is not None and bool(mask[row])
+
+        # The graph holds dequantized vectors: fetch extra candidates to re-rank exactly
+        labels = None
+        for fetch in dict.fromkeys((min(max(k, self.store.rerank_candidates), len(self.labels)), k)):
+            try:
+                labels, distances = self._index.knn_query(
+                    query, k=fetch, filter=allowed if mask is not None else None
+                )
+                break
+            except RuntimeError:
+                # Fewer than `fetch` reachable matches (e.g. a very selective filter)
+                continue
+        if labels is None:
+            return super().search(query, k, mask)
+        rows = np.array([self.store.row(self.label_ids[l]) for l in labels[0]], dtype=np.int64)
+        return self._rerank(rows, (1.0 - distances[0]).astype(np.float32), query, k)
+
+    def save(self):
+        if not self._dirty or self._index is None:
+            return
+        self._index.save_index(str(self.path))
+        with open(self.path.with_suffix(".json"), "w") as f:
+            json.dump({"labels": self.labels, "next_label": self._next_label}, f)
+        self._dirty = False
+
+    def load(self):
+        meta_path = self.path.with_suffix(".json")
+        if self.path.exists() and meta_path.exists() and len(self.store):
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                index = self._hnswlib.Index(space="ip", dim=self.store.dim)
+                index.load_index(str(self.path), max_elements=max(meta["next_label"], 1024))
+                index.set_ef(self.ef)
+                self._index = index
+                self.labels = meta["labels"]
+                self.label_ids = {label: dream_id for dream_id, label in self.labels.items()}
+                self._next_label = meta["next_label"]
+            except Exception as e:
+                print(f"Failed to load HNSW index from {self.path}: {e}")
+
+        self.remove([i for i in list(self.labels) if i not in self.store])
+        self.add([i for i in self.store.ids if i not in self.labels])
+
+
+def create_index(store: EmbeddingStore, kind: Optional[str] = None,
+                 directory: Optional[Path] = None) -> ExactIndex:
+    """Build the index selected by SEARCH_INDEX (exact, ivf or hnsw), persisted in `directory`."""
+    kind = (kind or os.getenv("SEARCH_INDEX", "exact")).lower()
+    directory = directory or IVF_FILE.parent
+    if kind == "ivf":
+        return IVFIndex(store, path=directory / IVF_FILE.name)
+    if kind == "hnsw":
+        try:
+            return HNSWIndex(store, path=directory / HNSW_FILE.name)
+        except ImportError:
+            print("hnswlib is not installed; falling back to exact search")
+    return ExactIndex(store)
+
+
+def evaluate_recall(index: ExactIndex, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """Compare an index against exact cosine ranking on the same store.
+
+    Returns mean recall@k plus median latencies of both, in milliseconds.
+    """
+    exact = ExactIndex(index.store)
+    recalls, exact_times, index_times = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        expected, _ = exact.search(query, k)
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found, _ = index.search(query, k)
+        index_times.append(time.perf_counter() - start)
+
+        if len(expected):
+            recalls.append(len(set(expected.tolist()) & set(found.tolist())) / len(expected))
+
+    return {
+        "index": index.name,
+        "queries": len(queries),
+        "k": k,
+        "recall": float(np.mean(recalls)) if recalls else 1.0,
+        "exact_p50_ms": float(np.median(exact_times) * 1000) if exact_times else 0.0,
+        "index_p50_ms": float(np.median(index_times) * 1000) if index_times else 0.0,
+    }
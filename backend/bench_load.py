@@ -0,0 +1,330 @@
+"""Load-test the API handlers with concurrent clients against synthetic corpora.
+
+For each corpus size a fresh process gets a temporary data directory with a
+generated corpus, replaces the Ollama client with a deterministic stub that
+streams a fixed roadmap, and drives the app in-process (httpx over ASGI, no
+sockets) with `-c` concurrent clients. Every endpoint gets `-r` requests:
+
+    list      GET  /dreams?limit=50 (every other request filtered by category)
+    get       GET  /dreams/{id}
+    batch     POST /dreams/batch (--batch-size new dreams per request)
+    search    GET  /search?q=... (the corpus is embedded once first: search_warmup_s)
+    roadmap   GET  /dreams/{id}/roadmap, read to the end of the stream
+    mixed     one write per request, in turn: a batch repeating an id, PATCH
+              /dreams/{id}, POST /dreams/{id}/milestones, DELETE /dreams/{id}
+
+Results are printed (or written with -o) as JSON: latency percentiles in
+milliseconds and throughput in requests/second per endpoint and size, plus
+the commit they were measured at. After the run, /dreams/stats is compared
+with a recount of the stored dreams (stats_match_recount). Pass --baseline with an earlier result file
+to print the p50/p99 change per endpoint.
+
+Usage: python bench_load.py [--sizes 1000,10000,100000,1000000] [-c 16] [-r 200]
+                            [--endpoints list,get,batch,search,roadmap,mixed]
+                            [--llm-chunk-ms 0] [-o results.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = ("list", "get", "batch", "search", "roadmap", "mixed")
+CATEGORIES = [
+    "Career & Business", "Finance & Wealth", "Health & Wellness", "Relationships & Family",
+    "Travel & Adventure", "Skills & Knowledge", "Lifestyle & Hobbies", "Other",
+]
+VERBS = ["Learn", "Run", "Visit", "Build", "Save for", "Write", "Start", "Master", "Climb", "Teach"]
+OBJECTS = ["a marathon", "Japanese", "the piano", "a startup", "Patagonia", "a novel", "a house",
+           "Mount Kilimanjaro", "machine learning", "a vegetable garden", "photography", "Iceland"]
+QUERIES = ["learn a language", "travel abroad", "get fit", "financial freedom", "write a book",
+           "start a business", "music", "\"mount kilimanjaro\"", "family time", "career change"]
+
+
+def synthetic_dream(rng: random.Random, i: int) -> Dict[str, Any]:
+    year = 2026 + rng.randrange(10)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "title": f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} #{i}",
+        "category": rng.choice(CATEGORIES),
+        "suggested_target_year": year,
+        "completed": rng.random() < 0.15,
+        "is_polished": False,
+        "smart_data": None,
+        "milestones": [
+            {"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)), "title": f"Step {j}",
+             "target_year": year - j, "completed": False}
+            for j in range(rng.randrange(4))
+        ],
+        "journal_entries": [
+            {"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+             "content": f"Progress note {j}: {rng.choice(VERBS).lower()} {rng.choice(OBJECTS)}",
+             "created_at": "2025-01-01T00:00:00"}
+            for j in range(rng.randrange(3))
+        ],
+        "notes": None,
+    }
+
+
+def write_corpus(path: str, size: int, seed: int) -> List[str]:
+    """Stream a corpus to `path` as a snapshot file; returns the dream ids."""
+    rng = random.Random(seed)
+    ids = []
+    with open(path, "w") as f:
+        f.write("[")
+        for i in range(size):
+            dream = synthetic_dream(rng, i)
+            ids.append(dream["id"])
+            f.write(("," if i else "") + json.dumps(dream))
+        f.write("]")
+    return ids
+
+
+class StubLLM:
+    """Deterministic stand-in for ChatOllama's streaming interface.
+
+    Streams the same roadmap for the same prompt, in fixed-size chunks, with
+    an optional delay per chunk to imitate token generation.
+    """
+
+    def __init__(self, chunk_delay: float = 0.0, chunk_size: int = 16):
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+
+    async def astream(self, prompt: Any):
+        rng = random.Random(str(prompt))
+        text = json.dumps([
+            {"id": f"m{n}", "title": f"{rng.choice(VERBS)} {rng.choice(OBJECTS)}", "target_year": 2026 + n}
+            for n in range(4)
+        ])
+        for start in range(0, len(text), self.chunk_size):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            else:
+                await asyncio.sleep(0)
+            yield SimpleNamespace(content=text[start:start + self.chunk_size])
+
+
+def summarize(latencies: List[float], errors: int, wall: float) -> Dict[str, Any]:
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "throughput_rps": len(ordered) / wall if wall else 0.0,
+    }
+
+
+async def drive(client, make_request, total: int, concurrency: int) -> Dict[str, Any]:
+    """Send `total` requests from `concurrency` clients; any non-2xx counts as an error."""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for n in remaining:
+            started = time.perf_counter()
+            try:
+                ok = await make_request(client, n)
+            except Exception as e:
+                print(f"Request failed: {e}", file=sys.stderr)
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_size(args) -> Dict[str, Any]:
+    os.chdir(tempfile.mkdtemp(prefix="bench_load_"))
+    os.makedirs("data")
+    started = time.perf_counter()
+    ids = write_corpus("data/dreams.json", args.size, args.seed)
+    result: Dict[str, Any] = {"size": args.size, "corpus_write_s": time.perf_counter() - started, "endpoints": {}}
+
+    import httpx
+    started = time.perf_counter()
+    from app.main import app
+    from app.services.analysis_service import analysis_service
+    from app.services.dream_stats import DreamStats
+    from app.services.search_service import search_service
+    from app.services.storage_service import storage_service
+
+    storage_service.load_dreams_raw()
+    # Importing the app loads the default owner's corpus
+    result["app_import_s"] = time.perf_counter() - started
+    analysis_service._llm = StubLLM(chunk_delay=args.llm_chunk_ms / 1000)
+    if "search" in args.endpoints:
+        started = time.perf_counter()
+        search_service.warm_up()
+        result["search_warmup_s"] = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    batch_rng = random.Random(args.seed + 1)
+
+    async def list_dreams(client, n):
+        params = {"limit": 50}
+        if n % 2:
+            params["category"] = CATEGORIES[n % len(CATEGORIES)]
+        return (await client.get("/dreams", params=params)).status_code == 200
+
+    async def get_dream(client, n):
+        return (await client.get(f"/dreams/{rng.choice(ids)}")).status_code == 200
+
+    async def save_batch(client, n):
+        dreams = [synthetic_dream(batch_rng, args.size + n * args.batch_size + i) for i in range(args.batch_size)]
+        return (await client.post("/dreams/batch", json=dreams)).status_code == 200
+
+    async def search(client, n):
+        response = await client.get("/search", params={"q": QUERIES[n % len(QUERIES)], "limit": 10})
+        return response.status_code == 200
+
+    async def roadmap(client, n):
+        async with client.stream("GET", f"/dreams/{rng.choice(ids)}/roadmap") as response:
+            lines = [line async for line in response.aiter_lines() if line]
+        return response.status_code == 200 and len(lines) > 0
+
+    created: List[str] = []
+
+    async def mixed(client, n):
+        # Only dreams created here are deleted, so the other scenarios keep finding theirs
+        kind = n % 4
+        if kind == 3 and created:
+            return (await client.delete(f"/dreams/{created.pop()}")).status_code == 200
+        if kind == 2:
+            milestone = {"title": f"Step {n}", "target_year": 2030, "completed": n % 3 == 0}
+            return (await client.post(f"/dreams/{rng.choice(ids)}/milestones", json=milestone)).status_code == 201
+        if kind == 1:
+            return (await client.patch(f"/dreams/{rng.choice(ids)}", json={"completed": n % 3 == 0})).status_code == 200
+        dream = synthetic_dream(batch_rng, args.size + args.requests * args.batch_size + n)
+        # The same id twice in one save: the second record replaces the first
+        dreams = [dream, dict(dream, completed=not dream["completed"], suggested_target_year=2035)]
+        if (await client.post("/dreams/batch", params={"dedup": "off"}, json=dreams)).status_code != 200:
+            return False
+        created.append(dream["id"])
+        return True
+
+    scenarios = {"list": list_dreams, "get": get_dream, "batch": save_batch, "search": search, "roadmap": roadmap,
+                 "mixed": mixed}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.endpoints:
+            make_request = scenarios[name]
+            # A few untimed requests so one-off costs (first validation, imports) don't skew p99
+            for n in range(min(args.concurrency, args.requests)):
+                await make_request(client, n)
+            result["endpoints"][name] = await drive(client, make_request, args.requests, args.concurrency)
+
+        # The aggregates are maintained change by change: they must agree with counting from scratch
+        stats = (await client.get("/dreams/stats")).json()
+    recount = DreamStats(storage_service.load_dreams_raw()).as_dict()
+    result["stats_match_recount"] = stats == recount
+    if stats != recount:
+        drifted = sorted(key for key in recount if stats.get(key) != recount[key])
+        print(f"/dreams/stats differs from a recount in: {', '.join(drifted)}", file=sys.stderr)
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the p50/p99 change of every endpoint measured in both runs."""
+    before = {(run["size"], name): stats for run in baseline["runs"] for name, stats in run["endpoints"].items()}
+    print(f"{'size':>8} {'endpoint':<8} {'p50 ms':>18} {'p99 ms':>18}", file=sys.stderr)
+    for run in results["runs"]:
+        for name, stats in run["endpoints"].items():
+            old = before.get((run["size"], name))
+            if old is None or "p50_ms" not in old or "p50_ms" not in stats:
+                continue
+            cells = [f"{old[key]:.2f}->{stats[key]:.2f} ({(stats[key] / old[key] - 1) * 100:+.0f}%)"
+                     if old[key] else f"{stats[key]:.2f}" for key in ("p50_ms", "p99_ms")]
+            print(f"{run['size']:>8} {name:<8} {cells[0]:>18} {cells[1]:>18}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("-r", "--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of " + ", ".join(ENDPOINTS))
+    parser.add_argument("--batch-size", type=int, default=10, help="dreams per POST /dreams/batch")
+    parser.add_argument("--llm-chunk-ms", type=float, default=0, help="stub LLM delay per streamed chunk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-o", "--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.size is not None:
+        # Child process: one corpus size, results on the last line of stdout
+        print(json.dumps(asyncio.run(run_size(args))))
+        return
+
+    runs = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        # Each size gets a fresh process, so singletons and caches start cold
+        command = [sys.executable, os.path.abspath(__file__), "--size", str(size),
+                   "-c", str(args.concurrency), "-r", str(args.requests), "--endpoints", ",".join(args.endpoints),
+                   "--batch-size", str(args.batch_size), "--llm-chunk-ms", str(args.llm_chunk_ms),
+                   "--seed", str(args.seed)]
+        print(f"Benchmarking {size} dreams...", file=sys.stderr)
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "llm_chunk_ms": args.llm_chunk_ms,
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Measure the per-request storage + serialization cost of dream reads, before
+and after caching validated models and their JSON.
+
+"before" repeats what the read path used to do for every request: build a
+DreamEntry from every raw record, then let the response model dump and
+re-validate them before serializing. "after" is the current path, with the
+cache warm (and once cold, right after loading).
+
+Runs against a synthetic corpus in a temporary data directory.
+
+Usage: python bench_reads.py [-n 1000] [--journal 10] [--milestones 5] [-r 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_dreams(n: int, journal: int, milestones: int) -> List[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Dream number {i}",
+            "category": "Skills & Knowledge",
+            "suggested_target_year": 2026 + i % 5,
+            "completed": i % 7 == 0,
+            "is_polished": True,
+            "smart_data": {key: f"{key} detail for dream {i} " * 4 for key in
+                           ("specific", "measurable", "achievable", "relevant", "time_bound")},
+            "milestones": [
+                {"id": str(uuid.uuid4()), "title": f"Milestone {j}", "target_year": 2026 + j % 3, "completed": False}
+                for j in range(milestones)
+            ],
+            "journal_entries": [
+                {"id": str(uuid.uuid4()), "content": f"Journal entry {j} " * 20, "created_at": "2025-01-01T00:00:00"}
+                for j in range(journal)
+            ],
+            "notes": None,
+        }
+        for i in range(n)
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    """Median milliseconds per call."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=1000, help="number of dreams")
+    parser.add_argument("--journal", type=int, default=10, help="journal entries per dream")
+    parser.add_argument("--milestones", type=int, default=5, help="milestones per dream")
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_reads_"))
+    os.makedirs("data")
+    dreams = synthetic_dreams(args.n, args.journal, args.milestones)
+    with open("data/dreams.json", "w") as f:
+        json.dump(dreams, f)
+
+    from pydantic import TypeAdapter
+    from app.models import DreamEntry
+    from app.services.storage_service import storage_service
+
+    response_list = TypeAdapter(List[DreamEntry])
+    records = storage_service.load_dreams_raw()
+    one_id = records[len(records) // 2]["id"]
+
+    def list_before():
+        models = [DreamEntry(**d) for d in storage_service.load_dreams_raw()]
+        response_list.dump_json(response_list.validate_python([m.model_dump() for m in models]))
+
+    one_raw = next(d for d in records if d["id"] == one_id)
+
+    def one_before():
+        model = DreamEntry(**one_raw)
+        DreamEntry.model_validate(model.model_dump()).model_dump_json()
+
+    started = time.perf_counter()
+    storage_service.list_dreams_json()
+    list_cold = (time.perf_counter() - started) * 1000
+
+    results = {
+        "dreams": args.n,
+        "journal_entries_per_dream": args.journal,
+        "milestones_per_dream": args.milestones,
+        "list_before_ms": timed(list_before, args.repeat),
+        "list_after_cold_ms": list_cold,
+        "list_after_ms": timed(storage_service.list_dreams_json, args.repeat),
+        "list_page_50_after_ms": timed(lambda: storage_service.list_dreams_json(limit=50), args.repeat),
+        "get_one_before_ms": timed(one_before, args.repeat),
+        "get_one_after_ms": timed(lambda: storage_service.get_dream_json(one_id), args.repeat),
+    }
+    results["list_speedup"] = results["list_before_ms"] / max(results["list_after_ms"], 1e-9)
+    results["get_one_speedup"] = results["get_one_before_ms"] / max(results["get_one_after_ms"], 1e-9)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
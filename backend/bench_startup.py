@@ -0,0 +1,46 @@
+"""Measure API process startup: import time of app.main and time until the
+background warm-up has loaded the models (GET /health/ready returns 200).
+
+Usage: python bench_startup.py [-n 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter() - started
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    live = client.get("/health/live").status_code
+    first_live = time.perf_counter() - started
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.05)
+    ready = time.perf_counter() - started
+print(f"RESULT {imported} {first_live} {ready}")
+"""
+
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True).stdout
+    line = next(l for l in output.splitlines() if l.startswith("RESULT "))
+    imported, first_live, ready = (float(v) for v in line.split()[1:])
+    return {"import_s": imported, "first_live_s": first_live, "ready_s": ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5, help="number of cold starts")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.n)]
+    summary = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+    print(json.dumps({"runs": runs, "median": summary}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Stream dreams to and from NDJSON files, one record per line.
+
+    python bulk.py export [-o dreams.ndjson] [--owner ID]
+    python bulk.py import dreams.ndjson [--owner ID] [--batch-size 500]
+
+Both run in constant memory and can run next to the API workers. They
+checkpoint to `<file>.checkpoint.json` after every page or batch: running the
+same command again after an interruption resumes where it stopped (a
+finished import is not repeated). Pass --restart to ignore the checkpoint.
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from app.services.bulk_io import EXPORT_PAGE_SIZE, IMPORT_BATCH_SIZE, import_lines
+from app.services.storage_service import storage_service, validate_owner
+
+
+def export(path: str, owner, restart: bool):
+    if path == "-":
+        for data, _ in _pages(owner, None):
+            sys.stdout.buffer.write(data)
+        return
+
+    checkpoint = Path(path + ".checkpoint.json")
+    state = {"cursor": None, "bytes": 0, "exported": 0}
+    if checkpoint.exists() and not restart:
+        with open(checkpoint) as f:
+            state = json.load(f)
+        print(f"Resuming export after {state['exported']} dreams", file=sys.stderr)
+    with open(path, "r+b" if state["bytes"] else "wb") as out:
+        # Anything past the checkpoint is a page that was only partly written
+        out.truncate(state["bytes"])
+        out.seek(state["bytes"])
+        for data, cursor in _pages(owner, state["cursor"]):
+            out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+            state = {"cursor": cursor, "bytes": out.tell(), "exported": state["exported"] + data.count(b"\n")}
+            with open(checkpoint, "w") as f:
+                json.dump(state, f)
+    checkpoint.unlink(missing_ok=True)
+    print(f"Exported {state['exported']} dreams to {path}", file=sys.stderr)
+
+
+def _pages(owner, cursor):
+    while True:
+        data, cursor = storage_service.export_ndjson(owner, cursor=cursor, limit=EXPORT_PAGE_SIZE)
+        yield data, cursor
+        if cursor is None:
+            return
+
+
+def import_file(path: str, owner, batch_size: int, restart: bool):
+    checkpoint = Path(path + ".checkpoint.json")
+    if restart:
+        checkpoint.unlink(missing_ok=True)
+    with open(path, "rb") as f:
+        summary = import_lines(f, owner=owner, checkpoint=checkpoint, batch_size=batch_size)
+    print(json.dumps(summary, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("-o", "--output", default="dreams.ndjson", help="file to write, or - for stdout")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    for sub in (export_parser, import_parser):
+        sub.add_argument("--owner", help="user id (default: the shared default owner)")
+        sub.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    owner = validate_owner(args.owner) if args.owner else None
+    if args.command == "export":
+        export(args.output, owner, args.restart)
+    else:
+        import_file(args.input, owner, args.batch_size, args.restart)
+
+
+if __name__ == "__main__":
+    main()
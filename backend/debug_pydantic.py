@@ -1,12 +1,11 @@
-import json
 from app.models import DreamEntry
+from app.services.storage_engine import DreamLog
+from app.services.storage_service import DATA_FILE, LOG_FILE
 from pydantic import ValidationError
 
-DATA_FILE = "data/dreams.json"
-
 try:
-    with open(DATA_FILE, "r") as f:
-        data = json.load(f)
+    # Snapshot plus any logged writes not yet compacted
+    data = list(DreamLog(DATA_FILE, LOG_FILE).load().values())
     
     print(f"Loaded {len(data)} items.")
     
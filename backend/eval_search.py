@@ -0,0 +1,33 @@
+"""Measure recall of the configured approximate search index against exact ranking.
+
+Usage: SEARCH_INDEX=ivf python eval_search.py [-k 10] [-n 200] [query ...]
+
+Without explicit queries, a sample of stored dream titles is used.
+"""
+import argparse
+import json
+import random
+from app.services.search_service import search_service
+from app.services.storage_service import storage_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("-n", type=int, default=200, help="number of sampled queries")
+    args = parser.parse_args()
+
+    queries = args.queries
+    if not queries:
+        titles = [d.get("title", "") for d in storage_service.load_dreams_raw() if d.get("title")]
+        queries = random.Random(0).sample(titles, min(args.n, len(titles)))
+    if not queries:
+        print("No dreams stored and no queries given.")
+        return
+
+    print(json.dumps(search_service.evaluate_recall(queries, k=args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Upgrade stored dreams to the current schema version and persist them.
+
+Storage already upgrades records as it loads them, so running this is never
+required for correctness; it writes the upgraded records back so processes
+stop re-migrating on every start. Outdated records are upgraded in chunks
+over several processes without holding the writer lock; the lock is only
+taken at the end to fold in writes made meanwhile and replace the snapshot,
+so API workers keep serving (and writing) during the migration.
+
+Usage: python migrate.py [--owner ID ...] [--workers 4] [--chunk-size 10000]
+"""
+import argparse
+import os
+
+from app.services.migrations import SCHEMA_VERSION, is_current, upgrade, upgrade_records
+from app.services.storage_engine import DreamLog, apply_op
+from app.services.storage_service import (DATA_FILE, DEFAULT_OWNER, LOG_FILE, USERS_DIR, owner_path,
+                                          validate_owner)
+
+MAX_ATTEMPTS = 5
+
+
+def owners():
+    yield DEFAULT_OWNER
+    if USERS_DIR.is_dir():
+        for entry in sorted(os.listdir(USERS_DIR)):
+            try:
+                yield validate_owner(entry)
+            except ValueError:
+                continue
+
+
+def migrate_owner(owner: str, workers: int, chunk_size: int) -> int:
+    """Number of records that were upgraded."""
+    log = DreamLog(owner_path(owner, DATA_FILE.name), owner_path(owner, LOG_FILE.name))
+    if not log.snapshot_path.exists() and not log.log_path.exists():
+        return 0
+    for _ in range(MAX_ATTEMPTS):
+        records = list(log.load().values())
+        outdated = sum(1 for record in records if not is_current(record))
+        if not outdated:
+            return 0
+        upgraded = {record["id"]: record for record in upgrade_records(records, workers, chunk_size)}
+        with log.locked():
+            ops = log.read_new_ops()
+            if ops is None:
+                # Another process compacted meanwhile: start over from its snapshot
+                continue
+            for op in ops:
+                apply_op(upgraded, op)
+            log.compact(upgrade(record) for record in upgraded.values())
+        return outdated
+    raise RuntimeError(f"Gave up migrating {owner}: the snapshot kept changing")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--owner", action="append", help="only these owners (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    selected = [validate_owner(owner) for owner in args.owner] if args.owner else list(owners())
+    for owner in selected:
+        try:
+            count = migrate_owner(owner, args.workers, args.chunk_size)
+            print(f"{owner}: upgraded {count} dreams to schema version {SCHEMA_VERSION}")
+        except Exception as e:
+            print(f"{owner}: migration failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
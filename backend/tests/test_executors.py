@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from app.services.executors import BoundedExecutor
+
+
+def test_cancelled_queued_runs_leave_the_queue():
+    pool = BoundedExecutor("test", max_workers=1, queue_limit=3)
+    release = threading.Event()
+
+    async def scenario():
+        blocker = asyncio.ensure_future(pool.run(release.wait))
+        waiting = [asyncio.ensure_future(pool.run(lambda: None)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert pool.stats()["queued"] == 2
+
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        release.set()
+        await blocker
+
+        assert pool.stats()["queued"] == 0
+        assert pool.stats()["active"] == 0
+        # The cancelled jobs no longer count against the limit
+        await asyncio.gather(*(pool.run(lambda: None) for _ in range(3)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+        pool.shutdown()
@@ -47,6 +47,7 @@ export interface DreamEntry {
     milestones?: Milestone[];
     journal_entries?: JournalEntry[];
     notes?: string;
+    duplicate_of?: string;
 }
 
 export interface DreamCollection {